@@ -0,0 +1,56 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from prometheus_client import Counter
+
+QUERY_EMBEDDING_CACHE_HITS = Counter(
+    "query_embedding_cache_hits_total",
+    "Query embeddings served from the cache",
+    ["model"],
+)
+
+QUERY_EMBEDDING_CACHE_MISSES = Counter(
+    "query_embedding_cache_misses_total",
+    "Query embeddings computed because they were not cached",
+    ["model"],
+)
+
+
+def normaliseQuery(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class queryEmbeddingCache:
+    "bounded LRU cache of query embeddings with a TTL, keyed on (model, normalised query)"
+
+    def __init__(self, maxsize=2048, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, model, query: str):
+        name = getattr(model, "model_name", type(model).__name__)
+        key = (name, normaliseQuery(query))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                QUERY_EMBEDDING_CACHE_HITS.labels(model=name).inc()
+                return entry[1]
+
+        QUERY_EMBEDDING_CACHE_MISSES.labels(model=name).inc()
+        # all-MiniLM-L6-v2 is uncased, embedding the normalised text gives the same vector
+        embedding = model.embed_query(key[1])
+        with self._lock:
+            self._entries[key] = (now + self.ttl, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return embedding
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,26 @@
+"""Process-pool side of document ingestion.
+
+Kept free of module-level heavy imports so spawned workers only pay for the
+embedding model, not for the API's Mongo clients and graph.
+"""
+import os
+
+_embedder = None
+
+
+def initEmbedder(model_name, threads):
+    global _embedder
+    import torch
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    # workers share the cores between them instead of each grabbing all of them
+    torch.set_num_threads(threads)
+    _embedder = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={"device": "cpu"})
+
+
+def embedBatch(texts):
+    return _embedder.embed_documents(texts)
+
+
+def threadsPerWorker(workers):
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
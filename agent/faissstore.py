@@ -0,0 +1,167 @@
+"""On-disk formats for the FAQ FAISS store.
+
+index.faiss / index.pkl are the exact store LangChain writes and what ingestion
+edits. Next to them we write read-only artefacts for the processes serving queries:
+
+- index.sq8.faiss / index.pq.faiss: the same vectors scalar- or product-quantised
+- index.db: the docstore and row -> id map in sqlite, read one row at a time
+"""
+import json
+import os
+import pickle
+import sqlite3
+import threading
+from collections.abc import Mapping
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+COMPRESSIONS = ("sq8", "pq")
+
+
+def compressIndex(index, compression):
+    "re-encodes the vectors of a flat index, keeping its metric"
+    vectors = index.reconstruct_n(0, index.ntotal)
+    dim = index.d
+    if compression == "sq8":
+        compressed = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, index.metric_type)
+    elif compression == "pq":
+        # 8-byte sub-vectors; small stores get fewer centroids so training stays valid
+        subquantizers = next(m for m in (dim // 8, dim // 4, dim // 2, dim) if m and dim % m == 0)
+        nbits = int(max(1, min(8, np.log2(max(2, index.ntotal)))))
+        compressed = faiss.IndexPQ(dim, subquantizers, nbits, index.metric_type)
+    else:
+        raise ValueError(f"unknown compression {compression!r}, expected one of {COMPRESSIONS}")
+    compressed.train(vectors)
+    compressed.add(vectors)
+    return compressed
+
+
+def writeDocstore(store, path):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE docs (id TEXT PRIMARY KEY, content TEXT, metadata TEXT)")
+        conn.execute("CREATE TABLE rows (position INTEGER PRIMARY KEY, id TEXT)")
+        conn.executemany(
+            "INSERT INTO rows VALUES (?, ?)", store.index_to_docstore_id.items()
+        )
+        conn.executemany(
+            "INSERT INTO docs VALUES (?, ?, ?)",
+            (
+                (docID, doc.page_content, json.dumps(doc.metadata, default=str))
+                for docID, doc in store.docstore._dict.items()
+            ),
+        )
+    conn.close()
+
+
+def writeDerived(store, directory, compression=None):
+    "writes the serving artefacts for store into directory, returns their file names"
+    names = ["index.db"]
+    writeDocstore(store, os.path.join(directory, "index.db"))
+    if compression:
+        name = f"index.{compression}.faiss"
+        faiss.write_index(compressIndex(store.index, compression), os.path.join(directory, name))
+        names.append(name)
+    return names
+
+
+class sqliteReader:
+    "one read-only sqlite connection per thread"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def one(self, sql, args):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn.execute(sql, args).fetchone()
+
+
+class readOnlyDocstoreError(PermissionError):
+    "the serving docstore was asked to change, only ingestion (index.pkl) can"
+
+
+class sqliteDocstore(Docstore):
+    "read-only docstore that loads a document only when a search returns it"
+
+    def __init__(self, path):
+        self.reader = sqliteReader(path)
+
+    def search(self, search):
+        row = self.reader.one("SELECT content, metadata FROM docs WHERE id = ?", (search,))
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def delete(self, ids):
+        raise readOnlyDocstoreError(
+            f"{self.reader.path} is a read-only serving docstore, delete from the ingested index.pkl and re-save it"
+        )
+
+
+class sqliteRowMap(Mapping):
+    "index row -> docstore id, looked up on demand instead of unpickled up front"
+
+    def __init__(self, path):
+        self.reader = sqliteReader(path)
+
+    def __getitem__(self, position):
+        row = self.reader.one("SELECT id FROM rows WHERE position = ?", (int(position),))
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __len__(self):
+        return self.reader.one("SELECT COUNT(*) FROM rows", ())[0]
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+
+class readOnlyFAISS(FAISS):
+    """the FAISS store served over the sqlite docstore; FAISS.delete would remove the
+    rows from the index before the docstore refused, so every mutator refuses first"""
+
+    def _refuse(self, *args, **kwargs):
+        raise readOnlyDocstoreError(
+            "this FAQ store is served read-only from index.db, edit the ingested index.pkl and re-save it"
+        )
+
+    add_texts = add_embeddings = delete = merge_from = _refuse
+
+
+def loadStore(db_path, embeddings, mmap=False, compression=None, lazy_docstore=False):
+    "opens the store for serving queries, falling back to the exact files when an artefact is missing"
+    flags = 0
+    if mmap:
+        # pages of a memory-mapped index are shared by every worker that opens it
+        flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+
+    indexPath = os.path.join(db_path, f"index.{compression}.faiss")
+    if not compression or not os.path.exists(indexPath):
+        indexPath = os.path.join(db_path, "index.faiss")
+    index = faiss.read_index(indexPath, flags)
+
+    docstorePath = os.path.join(db_path, "index.db")
+    store = FAISS
+    if lazy_docstore and os.path.exists(docstorePath):
+        docstore, rowMap = sqliteDocstore(docstorePath), sqliteRowMap(docstorePath)
+        store = readOnlyFAISS
+    else:
+        with open(os.path.join(db_path, "index.pkl"), "rb") as f:
+            docstore, rowMap = pickle.load(f)
+
+    return store(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=rowMap,
+    )
@@ -0,0 +1,336 @@
+"""Gateway in front of the LLM provider.
+
+Every LLM call made by the graph goes through one llmGateway, which
+
+- caps the calls in flight and queues the rest, rejecting new calls once the
+  queue is full or a call has waited longer than queue_timeout
+- gives each call a deadline
+- keeps a circuit breaker over the provider's recent error rate: while it is
+  open, calls go straight to the fallback model, or fail fast without one
+
+Sync callers (nodes run on the blocking pool) and async callers (ainvoke on the
+event loop) share the same slots. A streamed call holds its slot until the
+stream is exhausted or closed.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from langchain_core.runnables import Runnable
+from prometheus_client import Counter, Gauge
+
+QUEUE_DEPTH = Gauge("llm_gateway_queue_depth", "LLM calls waiting for a slot", ["gateway"])
+IN_FLIGHT = Gauge("llm_gateway_in_flight", "LLM calls holding a slot", ["gateway"])
+BREAKER_STATE = Gauge(
+    "llm_gateway_breaker_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open", ["gateway"]
+)
+REJECTED = Counter(
+    "llm_gateway_rejected_total", "LLM calls refused by the gateway", ["gateway", "reason"]
+)
+FALLBACKS = Counter(
+    "llm_gateway_fallback_total", "LLM calls sent to the fallback model", ["gateway"]
+)
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+
+class LLMUnavailable(RuntimeError):
+    "the gateway could not get an answer from the provider or the fallback"
+
+    status_code = 503
+
+
+class LLMOverloaded(LLMUnavailable):
+    "too many LLM calls are already in flight or queued"
+
+
+class circuitBreaker:
+    "opens when failure_rate of the last `window` calls failed, probes again after cooldown"
+
+    def __init__(self, window=20, min_calls=10, failure_rate=0.5, cooldown=30):
+        self.window = deque(maxlen=window)
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self._openedAt = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        "True when the call may go to the provider, at most one probe while half-open"
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._openedAt >= self.cooldown:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            if self.state == HALF_OPEN and self._probing:
+                self._probing = False
+                if ok:
+                    self.state = CLOSED
+                    self.window.clear()
+                else:
+                    self._open()
+                return
+            self.window.append(ok)
+            failures = self.window.count(False)
+            if (
+                self.state == CLOSED
+                and len(self.window) >= self.min_calls
+                and failures / len(self.window) >= self.failure_rate
+            ):
+                self._open()
+
+    def abandon(self):
+        "a call ended without a verdict (cancelled): a half-open probe is given back, so the next call probes"
+        with self._lock:
+            self._probing = False
+
+    def _open(self):
+        self.state = OPEN
+        self._openedAt = time.monotonic()
+        self.window.clear()
+
+
+class llmGateway:
+    def __init__(
+        self,
+        name="groq",
+        max_in_flight=16,
+        max_queue=64,
+        queue_timeout=10,
+        timeout=30,
+        breaker=None,
+    ):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.breaker = breaker or circuitBreaker()
+        self._lock = threading.Lock()
+        self._inFlight = 0
+        # threading.Event for sync waiters, (loop, future) for async ones, served FIFO
+        self._waiters = deque()
+        BREAKER_STATE.labels(gateway=name).set(CLOSED)
+
+    def _gauges(self):
+        QUEUE_DEPTH.labels(gateway=self.name).set(len(self._waiters))
+        IN_FLIGHT.labels(gateway=self.name).set(self._inFlight)
+
+    def _tryAcquire(self, waiter):
+        "takes a free slot, or queues waiter; under self._lock"
+        if self._inFlight < self.max_in_flight and not self._waiters:
+            self._inFlight += 1
+            self._gauges()
+            return True
+        if len(self._waiters) >= self.max_queue:
+            REJECTED.labels(gateway=self.name, reason="queue_full").inc()
+            raise LLMOverloaded(f"{self.max_queue} LLM calls already queued")
+        self._waiters.append(waiter)
+        self._gauges()
+        return False
+
+    def _abandon(self, waiter):
+        "False when the slot was handed to waiter meanwhile, so the caller now holds it"
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._gauges()
+                return True
+            return False
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                # the slot passes straight to the next waiter, _inFlight is unchanged
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    break
+                loop, future = waiter
+                if not future.done():
+                    loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(True))
+                    break
+            else:
+                self._inFlight -= 1
+            self._gauges()
+
+    def acquire(self):
+        waiter = threading.Event()
+        with self._lock:
+            if self._tryAcquire(waiter):
+                return
+        if not waiter.wait(self.queue_timeout) and self._abandon(waiter):
+            REJECTED.labels(gateway=self.name, reason="queue_timeout").inc()
+            raise LLMOverloaded(f"no LLM slot within {self.queue_timeout}s")
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._lock:
+            if self._tryAcquire(waiter):
+                return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[1]), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if self._abandon(waiter):
+                REJECTED.labels(gateway=self.name, reason="queue_timeout").inc()
+                raise LLMOverloaded(f"no LLM slot within {self.queue_timeout}s")
+        except asyncio.CancelledError:
+            if not self._abandon(waiter):
+                self.release()
+            raise
+
+    def _route(self, fallback):
+        "(use the primary model?), raising when the breaker is open and there is no fallback"
+        allowed = self.breaker.allow()
+        BREAKER_STATE.labels(gateway=self.name).set(self.breaker.state)
+        if allowed:
+            return True
+        if fallback is None:
+            REJECTED.labels(gateway=self.name, reason="breaker_open").inc()
+            raise LLMUnavailable(f"{self.name} circuit breaker is open")
+        FALLBACKS.labels(gateway=self.name).inc()
+        return False
+
+    def _record(self, ok):
+        self.breaker.record(ok)
+        BREAKER_STATE.labels(gateway=self.name).set(self.breaker.state)
+
+    def _abandonProbe(self):
+        # cancelled (client gone, outer wait_for) says nothing about the provider, but a
+        # half-open probe left taken would keep the breaker from ever closing
+        self.breaker.abandon()
+
+    def invoke(self, primary, fallback, input, config=None, **kwargs):
+        self.acquire()
+        try:
+            if not self._route(fallback):
+                return fallback.invoke(input, config, **kwargs)
+            try:
+                # the sync deadline is the client's own request timeout
+                response = primary.invoke(input, config, **kwargs)
+            except Exception:
+                self._record(False)
+                raise
+            except BaseException:
+                self._abandonProbe()
+                raise
+            self._record(True)
+            return response
+        finally:
+            self.release()
+
+    async def ainvoke(self, primary, fallback, input, config=None, **kwargs):
+        await self.aacquire()
+        try:
+            if not self._route(fallback):
+                return await asyncio.wait_for(fallback.ainvoke(input, config, **kwargs), self.timeout)
+            try:
+                response = await asyncio.wait_for(primary.ainvoke(input, config, **kwargs), self.timeout)
+            except asyncio.TimeoutError:
+                self._record(False)
+                raise LLMUnavailable(f"{self.name} did not answer within {self.timeout}s")
+            except Exception:
+                self._record(False)
+                raise
+            except BaseException:
+                self._abandonProbe()
+                raise
+            self._record(True)
+            return response
+        finally:
+            self.release()
+
+    def stream(self, primary, fallback, input, config=None, **kwargs):
+        self.acquire()
+        try:
+            if not self._route(fallback):
+                yield from fallback.stream(input, config, **kwargs)
+                return
+            try:
+                yield from primary.stream(input, config, **kwargs)
+            except GeneratorExit:
+                # the caller stopped reading early, the provider was answering
+                self._record(True)
+                raise
+            except Exception:
+                self._record(False)
+                raise
+            except BaseException:
+                self._abandonProbe()
+                raise
+            self._record(True)
+        finally:
+            self.release()
+
+    async def astream(self, primary, fallback, input, config=None, **kwargs):
+        await self.aacquire()
+        try:
+            usePrimary = self._route(fallback)
+            chunks = (primary if usePrimary else fallback).astream(input, config, **kwargs)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.timeout
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(
+                            chunks.__anext__(), max(deadline - loop.time(), 0)
+                        )
+                    except StopAsyncIteration:
+                        break
+                    yield chunk
+            except asyncio.TimeoutError:
+                if usePrimary:
+                    self._record(False)
+                raise LLMUnavailable(f"{self.name} did not finish within {self.timeout}s")
+            except GeneratorExit:
+                if usePrimary:
+                    self._record(True)
+                raise
+            except Exception:
+                if usePrimary:
+                    self._record(False)
+                raise
+            except BaseException:
+                if usePrimary:
+                    self._abandonProbe()
+                raise
+            finally:
+                await chunks.aclose()
+            if usePrimary:
+                self._record(True)
+        finally:
+            self.release()
+
+    def wrap(self, primary, fallback=None):
+        return gatedModel(gateway=self, primary=primary, fallback=fallback)
+
+
+class gatedModel(Runnable):
+    "a chat model (or a bound one) whose calls go through an llmGateway"
+
+    def __init__(self, gateway, primary, fallback=None):
+        self.gateway = gateway
+        self.primary = primary
+        self.fallback = fallback
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.gateway.invoke(self.primary, self.fallback, input, config, **kwargs)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await self.gateway.ainvoke(self.primary, self.fallback, input, config, **kwargs)
+
+    def stream(self, input, config=None, **kwargs):
+        return self.gateway.stream(self.primary, self.fallback, input, config, **kwargs)
+
+    def astream(self, input, config=None, **kwargs):
+        return self.gateway.astream(self.primary, self.fallback, input, config, **kwargs)
@@ -0,0 +1,64 @@
+"""Keeps chat prompts and checkpoints bounded for long-lived threads.
+
+The chat LLM only ever sees the system prompt, the running summary and the most
+recent turns that fit in the token budget. After a chat turn the compact node
+rolls everything older than the newest turns into the summary and removes those
+messages from the checkpoint.
+"""
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.constants import TAG_NOSTREAM
+
+# summaries are internal, keep them out of the /api/chat/stream token events
+SUMMARY_CONFIG = {"tags": [TAG_NOSTREAM], "run_name": "summarise"}
+
+
+def countTokens(messages):
+    return count_tokens_approximately(messages)
+
+
+def splitHistory(messages, max_tokens):
+    """(older, recent): recent is the longest run of whole turns at the end of messages
+    that fits in max_tokens, and always contains the latest turn.
+
+    a turn starts at a HumanMessage, so tool calls are never separated from their results
+    """
+    messages = list(messages)
+    starts = [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+    if not starts:
+        return [], messages
+    cut = starts[-1]
+    for start in reversed(starts[:-1]):
+        if countTokens(messages[start:]) > max_tokens:
+            break
+        cut = start
+    return messages[:cut], messages[cut:]
+
+
+def summaryMessage(summary):
+    if not summary:
+        return []
+    return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")]
+
+
+def summaryPrompt(summary, older):
+    "asks the LLM to fold older messages into the running summary"
+    transcript = "\n".join(
+        f"{message.type}: {message.content}" for message in older if message.content
+    )
+    return [
+        HumanMessage(
+            content=f"""
+        Update the running summary of a conversation between a bank customer and Rencie,
+        their banking assistant. Keep facts the assistant may need later (names, account
+        numbers, amounts, open questions, preferences) and drop small talk.
+        Reply with the updated summary only.
+
+        Current summary:
+        {summary or "(none)"}
+
+        New messages:
+        {transcript}
+        """
+        )
+    ]
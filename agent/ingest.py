@@ -0,0 +1,270 @@
+"""Knowledge-base ingestion: PDFs appended to (or removed from) the FAQ store off the request path.
+
+Several API workers share one faissDB directory, so every write takes an
+exclusive lock on faissDB/.write.lock (flock, released if the process dies) from
+loading the store to saving it; a document is embedded before the lock is taken,
+so writers only queue for the merge and the save. Job records are JSON files in
+faissDB/.jobs, so any worker can answer GET /create-vector-store/{job_id}.
+"""
+import contextlib
+import fcntl
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.vectorstores import FAISS
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from agent.ragsystem import faq, saveVectorStore
+from agent.embedworker import initEmbedder, embedBatch, threadsPerWorker
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def streamBatches(filepath, documentID, source, batch_size=64):
+    "yields chunk batches page by page, the PDF is never held in memory as a whole"
+    textsplitter = RecursiveCharacterTextSplitter(
+        chunk_size=200, separators=["\n\n", "\n", " ", ""]
+    )
+    batch, chunkNumber = [], 0
+    for pageNumber, page in enumerate(PyPDFLoader(filepath).lazy_load(), start=1):
+        for chunk in textsplitter.split_documents([page]):
+            chunk.metadata.update({"documentID": documentID, "source": source})
+            batch.append((f"{documentID}:{chunkNumber}", chunk))
+            chunkNumber += 1
+            if len(batch) >= batch_size:
+                yield pageNumber, batch
+                batch = []
+    if batch:
+        yield pageNumber, batch
+
+
+class embeddingPool:
+    "process pool that embeds chunk batches, each worker loads the model once"
+
+    def __init__(self, workers, model_name="sentence-transformers/all-MiniLM-L6-v2"):
+        self.workers = workers
+        self.model_name = model_name
+        self._executor = None
+
+    def executor(self):
+        if self._executor is None:
+            # spawn, not fork: the parent holds torch threads and Mongo clients
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=initEmbedder,
+                initargs=(self.model_name, threadsPerWorker(self.workers)),
+            )
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def embedDocument(store, embeddings, filepath, documentID, source, pool=None, batch_size=64):
+    """streams the PDF into store (created on the first batch when None) and returns (store, pages, chunks).
+
+    at most 2 * workers batches are in flight, so memory stays flat whatever the document size
+    """
+    pending = deque()
+    pages = chunks = 0
+
+    def drain(limit):
+        nonlocal store, chunks
+        while len(pending) > limit:
+            batch, vectors = pending.popleft()
+            if not isinstance(vectors, list):
+                vectors = vectors.result()
+            ids = [chunkID for chunkID, _ in batch]
+            pairs = list(zip([chunk.page_content for _, chunk in batch], vectors))
+            metadatas = [chunk.metadata for _, chunk in batch]
+            if store is None:
+                store = FAISS.from_embeddings(pairs, embeddings, metadatas=metadatas, ids=ids)
+            else:
+                store.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+            chunks += len(batch)
+
+    for pages, batch in streamBatches(filepath, documentID, source, batch_size):
+        texts = [chunk.page_content for _, chunk in batch]
+        if pool is None:
+            pending.append((batch, embeddings.embed_documents(texts)))
+        else:
+            pending.append((batch, pool.executor().submit(embedBatch, texts)))
+        drain(2 * pool.workers if pool else 0)
+    drain(0)
+    return store, pages, chunks
+
+
+@contextlib.contextmanager
+def writeLock(db_path):
+    "holds the store's write lock, across every process that writes db_path"
+    os.makedirs(db_path, exist_ok=True)
+    with open(os.path.join(db_path, ".write.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def openForWrite(retriever):
+    """a private copy of the on-disk store, the one serving queries is never mutated.
+    only call it under writeLock, and save before releasing it"""
+    if retriever.diskVersion() is None:
+        return None
+    return FAISS.load_local(
+        retriever.db_path, retriever.embeddings, allow_dangerous_deserialization=True
+    )
+
+
+def appendDocument(filepath, documentID, source, retriever=faq, pool=None, batch_size=64):
+    "embeds only the new document's chunks and adds them to the existing FAQ index"
+    # embedded into a store of its own first, the lock only covers the merge and the save
+    added, _, chunks = embedDocument(
+        None, retriever.embeddings, filepath, documentID, source, pool, batch_size
+    )
+    if not chunks:
+        return 0
+    with writeLock(retriever.db_path):
+        store = openForWrite(retriever)
+        if store is None:
+            store = added
+        else:
+            store.merge_from(added)
+        saveVectorStore(store, retriever.db_path)
+    retriever.reload()
+    return chunks
+
+
+def removeDocument(documentID, retriever=faq):
+    "drops every chunk that was ingested from documentID"
+    with writeLock(retriever.db_path):
+        store = openForWrite(retriever)
+        if store is None:
+            return 0
+        ids = [
+            docID
+            for docID in store.index_to_docstore_id.values()
+            if store.docstore.search(docID).metadata.get("documentID") == documentID
+        ]
+        if not ids:
+            return 0
+        store.delete(ids)
+        saveVectorStore(store, retriever.db_path)
+    retriever.reload()
+    return len(ids)
+
+
+class ingestionJobs:
+    """runs knowledge-base writes off the request path and tracks their status by jobID.
+
+    Jobs run in this process, one at a time; writeLock orders them against the other
+    workers' jobs. Their records live in jobs_path, shared by every worker.
+    """
+
+    def __init__(self, keep=1000, workers=0, batch_size=64, jobs_path=None):
+        self.keep = keep
+        self.batch_size = batch_size
+        self.jobs_path = jobs_path or os.path.join(faq.db_path, ".jobs")
+        # workers=0 embeds in the ingestion thread with the already loaded model
+        self.pool = embeddingPool(workers) if workers else None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+        self._lock = threading.Lock()
+
+    def _path(self, jobID):
+        return os.path.join(self.jobs_path, f"{jobID}.json")
+
+    def _save(self, job):
+        "writes the record next to its final name and moves it in, readers never see half of it"
+        os.makedirs(self.jobs_path, exist_ok=True)
+        fd, staging = tempfile.mkstemp(prefix=".job-", dir=self.jobs_path)
+        with os.fdopen(fd, "w") as f:
+            json.dump(job, f)
+        os.replace(staging, self._path(job["jobID"]))
+
+    def _prune(self):
+        "keeps the newest `keep` job records"
+        try:
+            records = [e for e in os.scandir(self.jobs_path) if e.name.endswith(".json")]
+        except FileNotFoundError:
+            return
+        records.sort(key=lambda e: e.stat().st_mtime)
+        for entry in records[: max(0, len(records) - self.keep)]:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(entry.path)
+
+    def _new(self, kind, documentID, **extra):
+        job = {
+            "jobID": uuid.uuid4().hex,
+            "kind": kind,
+            "documentID": documentID,
+            "status": "queued",
+            "chunks": None,
+            "error": None,
+            "createdAt": now(),
+            "finishedAt": None,
+            "pid": os.getpid(),
+            **extra,
+        }
+        self._save(job)
+        self._prune()
+        return job
+
+    def _run(self, job, fn, *args):
+        self._update(job, status="running")
+        try:
+            self._update(job, status="successful", chunks=fn(*args), finishedAt=now())
+        except Exception as e:
+            self._update(job, status="failed", error=str(e), finishedAt=now())
+
+    def _update(self, job, **fields):
+        with self._lock:
+            job.update(fields)
+            self._save(job)
+
+    def submitDocument(self, filepath, source):
+        documentID = uuid.uuid4().hex
+        job = self._new("append", documentID, source=source)
+
+        def ingest():
+            try:
+                return appendDocument(
+                    filepath, documentID, source, pool=self.pool, batch_size=self.batch_size
+                )
+            finally:
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+
+        self._executor.submit(self._run, job, ingest)
+        return dict(job)
+
+    def submitRemoval(self, documentID):
+        job = self._new("remove", documentID)
+        self._executor.submit(self._run, job, removeDocument, documentID)
+        return dict(job)
+
+    def status(self, jobID):
+        "the job's record, whichever worker runs it; None when unknown"
+        if not jobID.isalnum():
+            return None
+        try:
+            with open(self._path(jobID)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+
+ingestion = ingestionJobs(
+    workers=int(os.getenv("INGEST_WORKERS", "0")),
+    batch_size=int(os.getenv("INGEST_BATCH_SIZE", "64")),
+)
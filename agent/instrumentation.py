@@ -0,0 +1,159 @@
+"""Prometheus metrics for the agent graph, collected from LangChain callbacks.
+
+instrument(graph) binds one callback handler to the compiled graph, so every
+invoke/ainvoke/stream reports node and tool durations and per-LLM-call latency
+and token usage without the nodes doing anything.
+"""
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages.utils import count_tokens_approximately
+from prometheus_client import Counter, Histogram
+
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30]
+
+NODE_LATENCY = Histogram(
+    "graph_node_duration_seconds",
+    "Time spent in each agent graph node",
+    ["node", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+TOOL_LATENCY = Histogram(
+    "graph_tool_duration_seconds",
+    "Time spent in each tool called by the chat LLM",
+    ["tool", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+LLM_LATENCY = Histogram(
+    "llm_call_duration_seconds",
+    "LLM call latency",
+    ["model", "node", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+LLM_PROMPT_TOKENS = Counter(
+    "llm_prompt_tokens_total",
+    "Prompt tokens sent to the LLM",
+    ["model", "node"],
+)
+
+LLM_COMPLETION_TOKENS = Counter(
+    "llm_completion_tokens_total",
+    "Completion tokens returned by the LLM",
+    ["model", "node"],
+)
+
+PROMPT_SIZE = Histogram(
+    "llm_prompt_size_tokens",
+    "Prompt tokens per LLM call, from the provider's usage metadata when it reports it",
+    ["node"],
+    buckets=[64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768],
+)
+
+
+def errorStatus(error):
+    # interrupt() raises to pause the graph for the OTP, that is not a failure
+    return "interrupted" if type(error).__name__ in ("GraphInterrupt", "NodeInterrupt") else "error"
+
+
+class graphMetrics(BaseCallbackHandler):
+    "times graph nodes, tools and LLM calls by run_id"
+
+    # the handler only reads and writes its own dicts, keep it on the calling thread
+    run_inline = True
+
+    def __init__(self):
+        self._nodes = {}
+        self._tools = {}
+        self._llms = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # runs nested inside a node inherit its metadata, the node's own run carries its
+        # name (and so may the function it wraps, which is not timed twice)
+        if node and kwargs.get("name") == node and parent_run_id not in self._nodes:
+            self._nodes[run_id] = (node, time.perf_counter())
+
+    def _endNode(self, run_id, status):
+        started = self._nodes.pop(run_id, None)
+        if started:
+            node, start = started
+            NODE_LATENCY.labels(node=node, status=status).observe(time.perf_counter() - start)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._endNode(run_id, "ok")
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._endNode(run_id, errorStatus(error))
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        tool = kwargs.get("name") or (serialized or {}).get("name", "unknown")
+        self._tools[run_id] = (tool, time.perf_counter())
+
+    def _endTool(self, run_id, status):
+        started = self._tools.pop(run_id, None)
+        if started:
+            tool, start = started
+            TOOL_LATENCY.labels(tool=tool, status=status).observe(time.perf_counter() - start)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._endTool(run_id, "ok")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._endTool(run_id, "error")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = (
+            (metadata or {}).get("ls_model_name")
+            or params.get("model_name")
+            or params.get("model")
+            or "unknown"
+        )
+        node = (metadata or {}).get("langgraph_node", "none")
+        prompt = count_tokens_approximately(messages[0]) if messages else 0
+        self._llms[run_id] = (model, node, prompt, time.perf_counter())
+
+    def _endLLM(self, started, generations, stopped=False):
+        model, node, prompt, start = started
+        LLM_LATENCY.labels(model=model, node=node, status="ok").observe(time.perf_counter() - start)
+
+        usage, messages = {}, []
+        for candidates in generations:
+            for generation in candidates:
+                message = getattr(generation, "message", None)
+                if message is not None:
+                    messages.append(message)
+                usage = getattr(message, "usage_metadata", None) or usage
+        completion = usage.get("output_tokens") or 0
+        if stopped and not completion:
+            # providers report usage in the last chunk, which a stopped stream never reads
+            completion = count_tokens_approximately(messages) if messages else 0
+        promptTokens = usage.get("input_tokens") or prompt
+        PROMPT_SIZE.labels(node=node).observe(promptTokens)
+        LLM_PROMPT_TOKENS.labels(model=model, node=node).inc(promptTokens)
+        LLM_COMPLETION_TOKENS.labels(model=model, node=node).inc(completion)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._llms.pop(run_id, None)
+        if started:
+            self._endLLM(started, response.generations)
+
+    def on_llm_error(self, error, *, run_id, response=None, **kwargs):
+        started = self._llms.pop(run_id, None)
+        if not started:
+            return
+        if isinstance(error, GeneratorExit):
+            # the intent node closes the stream once it has the intent, that call succeeded;
+            # response holds what was streamed until then (and an error generation, skipped)
+            partial = response.generations[:1] if response and len(response.generations) > 1 else []
+            self._endLLM(started, partial, stopped=True)
+            return
+        model, node, _, start = started
+        LLM_LATENCY.labels(model=model, node=node, status="error").observe(time.perf_counter() - start)
+
+
+def instrument(graph):
+    "the compiled graph with the metrics handler bound to every run"
+    return graph.with_config(callbacks=[graphMetrics()])
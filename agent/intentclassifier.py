@@ -0,0 +1,154 @@
+"""Local first stage of intent classification.
+
+Keyword rules and a nearest-centroid model over the intent examples in
+intent_examples.json route the messages they are sure about. Anything else
+returns None and goes to the LLM intentAgent.
+"""
+import json
+import os
+import re
+from decimal import Decimal
+import numpy as np
+from prometheus_client import Counter
+
+INTENT_ROUTES = Counter(
+    "intent_routes_total",
+    "Chat turns routed by the local classifier (fast) or the LLM intentAgent (llm)",
+    ["stage"],
+)
+
+INTENTS = ("transfer", "check_balance", "bank_statement", "smalltalks")
+
+ACCOUNT = re.compile(r"(?<!\d)\d{10}(?!\d)")
+AMOUNT = re.compile(
+    r"(?<![\d.,])(\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)\s*(k|m|thousand|million)?\b",
+    re.IGNORECASE,
+)
+MULTIPLIERS = {"k": 1_000, "thousand": 1_000, "m": 1_000_000, "million": 1_000_000}
+
+RULES = {
+    "transfer": re.compile(r"\b(send|transfer|pay|wire|move)\b", re.IGNORECASE),
+    "check_balance": re.compile(
+        r"\b(balance|how much (money )?(do i have|have i got|is (left )?in my account))\b",
+        re.IGNORECASE,
+    ),
+    "bank_statement": re.compile(
+        r"\b(statement|transaction history|my transactions|account history)\b", re.IGNORECASE
+    ),
+    "smalltalks": re.compile(
+        r"^\s*(hi|hello|hey|good (morning|afternoon|evening)|thanks|thank you|how are you)\b",
+        re.IGNORECASE,
+    ),
+    # questions about how something works are FAQ material, whatever words they use;
+    # "is there a minimum balance?" names an intent's keyword without asking for it
+    "faq": re.compile(
+        r"\b(how (do|does|can|long)|what is the|limit|fee|charges?|reset|minimum|maximum|"
+        r"interest|is there|are there|why)\b",
+        re.IGNORECASE,
+    ),
+}
+
+# a banking keyword alone does not mean the user wants their own balance, statement or a
+# transfer ("news on the balance of trade", "the minister's statement"). Without the
+# embedding agreeing, a rule only routes a message addressed to the bank: first person,
+# or a bare command ("check balance", "statement please", "send 500 to ...")
+FIRST_PERSON = re.compile(r"\b(my|me|i|i'?d|i'?m|mine)\b", re.IGNORECASE)
+ADDRESSED = {
+    "transfer": re.compile(
+        r"^\s*(please\s+|(can|could) you\s+)?(send|transfer|pay|wire|move)\b", re.IGNORECASE
+    ),
+    "check_balance": re.compile(
+        r"^\s*(please\s+)?(check|show|get)?\s*(the\s+)?(account\s+)?balance\s*(please|now)?\W*$",
+        re.IGNORECASE,
+    ),
+    "bank_statement": re.compile(
+        r"^\s*(please\s+)?(send|get|show|email|give)?\s*(a\s+|the\s+)?(bank\s+|account\s+)?"
+        r"statement\s*(please|now)?\W*$",
+        re.IGNORECASE,
+    ),
+}
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "intent_examples.json")
+
+
+def extractTransfer(text):
+    """returns (receiverAccountNumber, amount), either may be None.
+    amounts are whole, positive naira: 0 or a fractional one ("1500.75") is None rather than rounded"""
+    accounts = list(ACCOUNT.finditer(text))
+    account = accounts[0].group(0) if len(accounts) == 1 else None
+    amounts = []
+    for match in AMOUNT.finditer(text):
+        if any(match.start() < a.end() and a.start() < match.end() for a in accounts):
+            continue
+        value = Decimal(match.group(1).replace(",", ""))
+        value *= MULTIPLIERS.get((match.group(2) or "").lower(), 1)
+        # nothing to transfer for 0, and a fraction is not rounded
+        amounts.append(int(value) if value > 0 and value == value.to_integral_value() else None)
+    amount = amounts[0] if len(amounts) == 1 else None
+    return account, amount
+
+
+class intentClassifier:
+    "rules plus an embedding nearest-centroid model, returns None whenever it is not confident"
+
+    def __init__(self, embed=None, min_similarity=0.55, min_margin=0.08, examples=EXAMPLES):
+        self.embed = embed
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.examples = examples
+        self._centroids = None
+
+    def centroids(self):
+        if self._centroids is None:
+            with open(self.examples) as f:
+                examples = json.load(f)
+            rows = []
+            for intent in INTENTS:
+                vectors = np.asarray([self.embed(text) for text in examples[intent]], dtype=np.float32)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                centroid = vectors.mean(axis=0)
+                rows.append(centroid / np.linalg.norm(centroid))
+            self._centroids = np.vstack(rows)
+        return self._centroids
+
+    def nearest(self, text):
+        "(intent, similarity, margin over the runner-up)"
+        query = np.asarray(self.embed(text), dtype=np.float32)
+        scores = self.centroids() @ (query / np.linalg.norm(query))
+        first, second = np.argsort(-scores)[:2]
+        return INTENTS[first], float(scores[first]), float(scores[first] - scores[second])
+
+    @staticmethod
+    def addressed(intent, text):
+        return FIRST_PERSON.search(text) is not None or ADDRESSED[intent].search(text) is not None
+
+    def classify(self, text):
+        fired = {intent for intent in INTENTS if RULES[intent].search(text)}
+        faq = RULES["faq"].search(text) is not None
+        account, amount = extractTransfer(text)
+
+        ruled = None
+        if len(fired) == 1 and not faq:
+            ruled = next(iter(fired))
+
+        embedded = None
+        if self.embed is not None:
+            intent, similarity, margin = self.nearest(text)
+            if similarity >= self.min_similarity and margin >= self.min_margin:
+                embedded = intent
+
+        if ruled and embedded and ruled != embedded:
+            return None
+        if ruled in ADDRESSED and embedded is None and not self.addressed(ruled, text):
+            # one keyword is not enough to start an OTP flow, the LLM decides
+            return None
+        intent = ruled or embedded
+        if intent is None or (faq and intent != "smalltalks"):
+            return None
+        if intent == "transfer":
+            # the secure flow needs both fields, let the LLM deal with incomplete requests
+            # (and fractional amounts, which intentPayload's int amount rejects too)
+            if account is None or amount is None:
+                return None
+            return {"intent": "transfer", "receiverAccountNumber": account, "amount": amount}
+        return {"intent": intent}
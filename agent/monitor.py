@@ -12,7 +12,7 @@ from evidently.descriptors import (
 )
 import pandas as pd
 import warnings
-from pymongo import MongoClient
+from rencie.db import getClient, getDatabase
 import os
 from dotenv import load_dotenv
 
@@ -24,8 +24,8 @@ class monitorllm:
     "this class encapsulates the monitoring of the llm agent"
 
     def __init__(self):
-        self.client = MongoClient(os.getenv("MONGO"))
-        self.db = self.client["responses"]
+        self.client = getClient()
+        self.db = getDatabase("responses", workload="analytics")
         self.collection = self.db["mdresponses"]
 
     def analysisData(self) -> pd.DataFrame:
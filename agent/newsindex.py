@@ -0,0 +1,326 @@
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+import faiss
+import numpy as np
+from bson import ObjectId, json_util
+
+
+def hnswIndex(dim, m=32, ef_construction=200, ef_search=64):
+    "inner-product HNSW graph, vectors are unit length so scores are cosine similarities"
+    index = faiss.IndexHNSWFlat(dim, m, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = ef_construction
+    index.hnsw.efSearch = ef_search
+    return index
+
+
+def toTimestamp(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    if isinstance(value, str):
+        try:
+            return toTimestamp(datetime.fromisoformat(value))
+        except ValueError:
+            return 0.0
+    return 0.0
+
+
+def normalise(vectors):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def storedVectors(index):
+    "a read-only view of the vectors an HNSW index holds, without copying them"
+    flat = faiss.downcast_index(index.storage)
+    return faiss.rev_swig_ptr(flat.get_xb(), index.ntotal * index.d).reshape(index.ntotal, index.d)
+
+
+class newsIndex:
+    """persistent FAISS HNSW index over the whole finance_news archive, kept in sync on fetched_at.
+
+    Loading, syncing and persisting run on a background thread (start()); search()
+    only reads the current snapshot, so a query never waits for the archive to be
+    indexed or written to disk.
+    """
+
+    FIELDS = {"embedding": 1, "fetched_at": 1}
+    ARTICLE_FIELDS = {"title": 1, "summary": 1, "link": 1, "published": 1, "fetched_at": 1}
+
+    def __init__(
+        self,
+        collection,
+        path="newsDB",
+        sync_interval=30,
+        persist_interval=300,
+        ef_search=64,
+        brute_force_below=20_000,
+        keep_versions_seconds=3600,
+    ):
+        self.collection = collection
+        self.path = path
+        self.sync_interval = sync_interval
+        self.persist_interval = persist_interval
+        self.ef_search = ef_search
+        self.brute_force_below = brute_force_below
+        # other processes may still be loading an older version, it is only deleted after this long
+        self.keep_versions_seconds = keep_versions_seconds
+        self._lock = threading.Lock()
+        # faiss does not allow searching an HNSW graph while it is being added to
+        self._indexLock = threading.Lock()
+        # row i of the index is the article whose ObjectId bytes are ids[i], fetched at fetched[i]
+        # rows are appended in fetched_at order, so fetched is sorted
+        self._snapshot = (None, np.zeros((0, 12), dtype=np.uint8), np.zeros(0))
+        self._watermark = None
+        self._seenAtWatermark = set()
+        self._lastSync = None
+        self._lastPersist = None
+        self._dirty = False
+        self._loaded = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------- persistence ----------
+
+    def _currentDir(self):
+        try:
+            with open(os.path.join(self.path, "CURRENT")) as f:
+                return os.path.join(self.path, f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def load(self, attempts=3):
+        for _ in range(attempts):
+            directory = self._currentDir()
+            if directory is None or not os.path.isdir(directory):
+                return False
+            try:
+                index = faiss.read_index(os.path.join(directory, "index.faiss"))
+                ids = np.load(os.path.join(directory, "ids.npy"))
+                fetched = np.load(os.path.join(directory, "fetched.npy"))
+                with open(os.path.join(directory, "state.json")) as f:
+                    state = json_util.loads(f.read())
+                break
+            except (FileNotFoundError, RuntimeError):
+                # pruned by another process while being read, CURRENT points somewhere newer
+                continue
+        else:
+            return False
+        index.hnsw.efSearch = self.ef_search
+        with self._indexLock:
+            self._snapshot = (index, ids, fetched)
+        self._lastPersist = time.monotonic()
+        self._watermark = state["watermark"]
+        self._seenAtWatermark = set(state["seen"])
+        return True
+
+    def persist(self):
+        "writes a new version directory and flips CURRENT to it, readers in other processes never see a partial index"
+        with self._indexLock:
+            index, ids, fetched = self._snapshot
+            if index is None:
+                return
+            data = faiss.serialize_index(index)
+        os.makedirs(self.path, exist_ok=True)
+        name = f"v{time.time_ns()}-{os.getpid()}"
+        directory = os.path.join(self.path, name)
+        os.makedirs(directory)
+        data.tofile(os.path.join(directory, "index.faiss"))
+        np.save(os.path.join(directory, "ids.npy"), ids)
+        np.save(os.path.join(directory, "fetched.npy"), fetched)
+        with open(os.path.join(directory, "state.json"), "w") as f:
+            f.write(json_util.dumps({"watermark": self._watermark, "seen": list(self._seenAtWatermark)}))
+        pointer = os.path.join(self.path, f".CURRENT-{os.getpid()}")
+        with open(pointer, "w") as f:
+            f.write(name)
+        os.replace(pointer, os.path.join(self.path, "CURRENT"))
+        self._lastPersist, self._dirty = time.monotonic(), False
+
+        self._prune(keep={name})
+
+    def _prune(self, keep):
+        "deletes versions that are neither among the two newest nor younger than keep_versions_seconds"
+        versions = sorted(d for d in os.listdir(self.path) if d.startswith("v"))
+        cutoff = time.time() - self.keep_versions_seconds
+        for old in versions[:-2]:
+            directory = os.path.join(self.path, old)
+            try:
+                if old in keep or os.path.getmtime(directory) > cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            shutil.rmtree(directory, ignore_errors=True)
+
+    # ---------- syncing ----------
+
+    def _due(self):
+        return self._lastSync is None or time.monotonic() - self._lastSync >= self.sync_interval
+
+    def sync(self, force=False, batch_size=2000):
+        """adds the articles fetched since the watermark; the first run on an empty path indexes the whole archive.
+        runs on the background thread, see start()"""
+        if not force and not self._due():
+            return
+        with self._lock:
+            if not force and not self._due():
+                return
+            if not self._loaded:
+                self.load()
+                self._loaded = True
+
+            query = {}
+            if self._watermark is not None:
+                query = {"fetched_at": {"$gte": self._watermark}}
+            cursor = (
+                self.collection.find(query, self.FIELDS, allow_disk_use=True)
+                .sort("fetched_at", 1)
+                .batch_size(batch_size)
+            )
+
+            added, batch = 0, []
+            for doc in cursor:
+                if doc["_id"] in self._seenAtWatermark:
+                    continue
+                fetched_at = doc.get("fetched_at")
+                if fetched_at is not None:
+                    if fetched_at != self._watermark:
+                        self._watermark, self._seenAtWatermark = fetched_at, set()
+                    self._seenAtWatermark.add(doc["_id"])
+                if doc.get("embedding") and isinstance(doc["_id"], ObjectId):
+                    batch.append(doc)
+                if len(batch) >= batch_size:
+                    added += self._add(batch)
+                    batch = []
+            if batch:
+                added += self._add(batch)
+
+            self._lastSync = time.monotonic()
+            if added:
+                self._dirty = True
+            # the first build of the archive is written straight away, later adds are batched
+            if self._dirty and (
+                self._lastPersist is None
+                or time.monotonic() - self._lastPersist >= self.persist_interval
+            ):
+                self.persist()
+
+    def _add(self, docs):
+        vectors = normalise([doc["embedding"] for doc in docs])
+        binaries = np.frombuffer(b"".join(doc["_id"].binary for doc in docs), dtype=np.uint8)
+        timestamps = np.array([toTimestamp(doc.get("fetched_at")) for doc in docs])
+        with self._indexLock:
+            index, ids, fetched = self._snapshot
+            if index is None:
+                index = hnswIndex(vectors.shape[1], ef_search=self.ef_search)
+            # search() bisects fetched, so it must stay sorted: a row without a usable
+            # fetched_at (or one of another BSON type, which Mongo sorts apart) takes the
+            # time of the row before it
+            floor = fetched[-1] if len(fetched) else 0.0
+            timestamps = np.maximum.accumulate(np.maximum(timestamps, floor))
+            index.add(vectors)
+            ids = np.concatenate([ids, binaries.reshape(-1, 12)])
+            fetched = np.concatenate([fetched, timestamps])
+            self._snapshot = (index, ids, fetched)
+        return len(docs)
+
+    # ---------- background job ----------
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"news index sync failed: {e}")
+            self._stop.wait(self.sync_interval)
+
+    def start(self):
+        "starts the background sync if it is not running in this process, returns at once"
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="news-index-sync", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._dirty:
+            self.persist()
+
+    # ---------- searching ----------
+
+    def search(self, query_embedding, k=5, max_age_days=None, recency_weight=0.0, half_life_days=7.0):
+        """returns the k best (score, article) pairs.
+
+        max_age_days drops anything fetched earlier than that, recency_weight adds
+        weight * 0.5 ** (age / half_life_days) to the similarity of each candidate
+        """
+        query = normalise(query_embedding).reshape(1, -1)
+        now = time.time()
+        candidates = k if not recency_weight else max(k * 10, 50)
+
+        with self._indexLock:
+            index, ids, fetched = self._snapshot
+            rows = len(ids)
+            if index is None or not rows:
+                return []
+            start = 0
+            if max_age_days is not None:
+                start = int(np.searchsorted(fetched, now - max_age_days * 86400, side="left"))
+                if start >= rows:
+                    return []
+
+            if rows - start <= self.brute_force_below:
+                # small (or heavily filtered) ranges are cheaper, and exact, as a matrix product
+                # over the index's own storage (the lock keeps it from being reallocated)
+                scores = storedVectors(index)[start:rows] @ query[0]
+                count = min(candidates, len(scores))
+                positions = np.argpartition(-scores, count - 1)[:count]
+                scores, positions = scores[positions], positions + start
+            else:
+                params, selector = None, None
+                if start:
+                    selector = faiss.IDSelectorRange(start, rows)
+                    params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(self.ef_search, candidates))
+                scores, positions = index.search(query, candidates, params=params)
+                keep = positions[0] >= 0
+                scores, positions = scores[0][keep], positions[0][keep]
+
+        if recency_weight:
+            age_days = np.maximum(now - fetched[positions], 0) / 86400
+            scores = scores + recency_weight * np.power(0.5, age_days / half_life_days)
+        order = np.argsort(-scores)[:k]
+        scores, positions = scores[order], positions[order]
+
+        wanted = [ObjectId(ids[p].tobytes()) for p in positions]
+        found = {
+            doc["_id"]: doc
+            for doc in self.collection.find({"_id": {"$in": wanted}}, self.ARTICLE_FIELDS)
+        }
+        return [
+            (float(score), found[_id])
+            for score, _id in zip(scores, wanted)
+            if _id in found
+        ]
+
+
+@lru_cache(maxsize=None)
+def getNewsIndex():
+    "the process's news index over renci_db.finance_news, configured from NEWS_* (not started)"
+    from rencie.db import getDatabase
+
+    return newsIndex(
+        getDatabase("renci_db", workload="news")["finance_news"],
+        path=os.getenv("NEWS_INDEX_PATH", os.path.join(os.getcwd(), "newsDB")),
+        sync_interval=float(os.getenv("NEWS_SYNC_INTERVAL", "30")),
+        persist_interval=float(os.getenv("NEWS_PERSIST_INTERVAL", "300")),
+        ef_search=int(os.getenv("NEWS_EF_SEARCH", "64")),
+    )
@@ -1,25 +1,39 @@
 from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, START, END
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage, RemoveMessage
 from typing import Sequence, Annotated, TypedDict, Literal
 from langchain.tools import tool
+from langchain_core.runnables import RunnableLambda
+from functools import lru_cache
+from contextlib import aclosing, closing
 import numpy as np
-from langchain_google_genai import ChatGoogleGenerativeAI
 from dotenv import load_dotenv
-from langgraph.checkpoint.mongodb import MongoDBSaver
-from pymongo import MongoClient
 from langgraph.prebuilt import ToolNode, tools_condition
 from langgraph.types import interrupt, Command
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from rencie.logic import *
 from agent.tools import *
 from agent.ragsystem import *
+from agent.semcache import cacheScope
+from agent.intentclassifier import intentClassifier, INTENT_ROUTES
+from agent.instrumentation import instrument
+from agent.history import (
+    SUMMARY_CONFIG,
+    countTokens,
+    splitHistory,
+    summaryMessage,
+    summaryPrompt,
+)
+from rencie.aio import runBlocking
+from rencie.db import getClient
 
 # load_dotenv(dotenv_path=r".\all.env")
-MONGO = os.getenv("MONGODB")
 
-client = MongoClient(MONGO)
-checkpointer = MongoDBSaver(client, db_name="my_database")
+
+@lru_cache(maxsize=None)
+def getCheckpointer():
+    from langgraph.checkpoint.mongodb import MongoDBSaver
+
+    return MongoDBSaver(getClient(), db_name="my_database")
 
 
 SYSTEM_PROMPT = SystemMessage(
@@ -45,111 +59,206 @@ class AgentState(TypedDict, total=False):
     dataComplete: bool
     otpAttempts: int
     otpDone: bool
+    summary: str
+    recipientValid: bool
+
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+
+
+# every Groq call shares one gateway: a cap on calls in flight, a bounded queue and a
+# circuit breaker that moves traffic to Gemini (when GOOGLE_API_KEY is set) or fails fast
+@lru_cache(maxsize=None)
+def getGateway():
+    from agent.gateway import llmGateway, circuitBreaker
+
+    return llmGateway(
+        name="groq",
+        max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "16")),
+        max_queue=int(os.getenv("LLM_MAX_QUEUE", "64")),
+        queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "10")),
+        timeout=LLM_TIMEOUT,
+        breaker=circuitBreaker(
+            window=int(os.getenv("LLM_BREAKER_WINDOW", "20")),
+            min_calls=int(os.getenv("LLM_BREAKER_MIN_CALLS", "10")),
+            failure_rate=float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5")),
+            cooldown=float(os.getenv("LLM_BREAKER_COOLDOWN", "30")),
+        ),
+    )
+
+
+def groqModel():
+    from langchain_groq import ChatGroq
+
+    return ChatGroq(
+        model="llama-3.3-70b-versatile",
+        temperature=0,
+        timeout=LLM_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+    )
+
+
+def geminiModel():
+    if not os.getenv("GOOGLE_API_KEY"):
+        return None
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash",
+        temperature=0,
+        timeout=LLM_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+    )
+
+
+# the clients are created by the first chat turn, not when the module is imported
+@lru_cache(maxsize=None)
+def getLLM():
+    return getGateway().wrap(groqModel(), geminiModel())
+
+# the intent call is forced to answer through the intentPayload schema
+@lru_cache(maxsize=None)
+def getIntentLLM():
+    fallback = geminiModel()
+    return getGateway().wrap(
+        groqModel().bind_tools([intentPayload], tool_choice="intentPayload"),
+        fallback.bind_tools([intentPayload], tool_choice="intentPayload") if fallback else None,
+    )
+
+@lru_cache(maxsize=None)
+def getChatLLM():
+    tools = [vectordbMemory, search_finance_news]
+    fallback = geminiModel()
+    return getGateway().wrap(
+        groqModel().bind_tools(tools), fallback.bind_tools(tools) if fallback else None
+    )
+
+# history sent to the chat LLM is capped at CHAT_TOKEN_BUDGET tokens; once a thread goes
+# over it, the compact node folds all but the last CHAT_KEEP_TOKENS into the summary
+# (CHAT_SUMMARY=0 drops them instead)
+CHAT_TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", "4000"))
+CHAT_KEEP_TOKENS = int(os.getenv("CHAT_KEEP_TOKENS", str(CHAT_TOKEN_BUDGET // 2)))
+CHAT_SUMMARY = os.getenv("CHAT_SUMMARY", "1") == "1"
 
+toolnode = ToolNode([vectordbMemory, search_finance_news])
 
-# llm = ChatGoogleGenerativeAI(
-#     model="gemini-2.5-flash",
-#     temperature=0,
-# )
-
-# chat_llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0).bind_tools(
-#     [vectordbMemory]
-# )
-
-from langchain_groq import ChatGroq
+# opt-in: SEMANTIC_CACHE=1 answers repeated FAQ/smalltalk questions without calling the chat LLM
+@lru_cache(maxsize=None)
+def getResponseCache():
+    if os.getenv("SEMANTIC_CACHE", "0") != "1":
+        return None
+    from agent.semcache import semanticCache
+
+    return semanticCache(
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+        maxsize=int(os.getenv("SEMANTIC_CACHE_SIZE", "1000")),
+        ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "900")),
+    )
+
+# FAST_INTENT=0 sends every turn to the LLM intentAgent
+@lru_cache(maxsize=None)
+def getIntentClassifier():
+    if os.getenv("FAST_INTENT", "1") != "1":
+        return None
+    embed = None
+    if os.getenv("FAST_INTENT_EMBEDDINGS", "1") == "1":
+        embed = lambda text: query_embeddings.embed(getNewsModel(), text)
+    return intentClassifier(
+        embed=embed,
+        min_similarity=float(os.getenv("FAST_INTENT_MIN_SIMILARITY", "0.55")),
+        min_margin=float(os.getenv("FAST_INTENT_MIN_MARGIN", "0.08")),
+    )
+
+def intentPrompt(message: str) -> str:
+    return f"""
+    Your name is Rencie, you are an intent classifier and structured data extractor for a banking assistant.
+
+    Call intentPayload with the user's intent and only the data relevant to that intent.
+
+    ---
+    Allowed intents:
+    - transfer → user wants to send money to another account
+    - check_balance → user wants to know their account balance
+    - bank_statement → user wants a transaction/bank statement
+    - smalltalks → greetings, casual chat, or unrelated messages
+
+    ---
+    User message:
+    {message}
+    ---
+
+    Extraction rules:
+    - If a field is missing or unclear, leave it null.
+    - Do NOT guess or fabricate values.
+    """
+
+
+def intentUpdate(payload: intentPayload):
+    "the state update for the intentAgent's intentPayload"
+    print(payload)
+    if payload.intent == "transfer":
+        return {
+            "intent": payload.intent,
+            "receiverAccountNumber": payload.receiverAccountNumber,
+            "amount": payload.amount,
+        }
+    return {"intent": payload.intent}
 
-llm = ChatGroq(
-    model="llama-3.3-70b-versatile",
-    temperature=0,
-)
 
-chat_llm = ChatGroq(
-    model="llama-3.3-70b-versatile",
-    temperature=0).bind_tools([vectordbMemory, search_finance_news])
+def intentFailed(error: intentParseError):
+    # a bad answer never starts a secure flow, the chat LLM gets the message instead
+    print(f"intent LLM answer rejected: {error}")
+    INTENT_PARSE_FAILURES.inc()
+    return {"intent": "smalltalks"}
 
-toolnode = ToolNode([vectordbMemory, search_finance_news])
 
 class agents:
+    @staticmethod
+    def fastIntent(state: AgentState):
+        classifier = getIntentClassifier()
+        if classifier:
+            routed = classifier.classify(state["messages"][-1].content)
+            if routed:
+                INTENT_ROUTES.labels(stage="fast").inc()
+                print(routed)
+                return routed
+        INTENT_ROUTES.labels(stage="llm").inc()
+        return None
+
     @staticmethod
     def intentAgent(state: AgentState) -> AgentState:
-        prompt = f"""
-        Your name is Rencie, you are an intent classifier and structured data extractor for a banking assistant.
-
-        Your task:
-        1. Identify the user's intent.
-        2. Extract only the data relevant to that intent.
-        3. Return valid JSON ONLY — no explanations, no markdown.
-
-        ---
-        Allowed intents:
-        - transfer → user wants to send money to another account
-        - check_balance → user wants to know their account balance
-        - bank_statement → user wants a transaction/bank statement
-        - smalltalks → greetings, casual chat, or unrelated messages
-
-        ---
-        User message:
-        {state["messages"][-1].content}
-        ---
-
-        Extraction rules:
-        - If a field is missing or unclear, return null.
-        - Do NOT guess or fabricate values.
-        - Amount must be returned as a string (e.g. "5000").
-        - Account numbers must be returned as strings.
-        - Confidence level must be an integer between 0 and 100.
-
-        ---
-
-        Response format (STRICT JSON):
-
-        If intent is "transfer":
-        {{
-        "confidence_level": 0-100,
-        "intent": "transfer",
-        "data": {{
-            "receiverAccountNumber": string | null,
-            "amount":  this should be an integer not string | null
-        }}
-        }}
-
-        If intent is "check_balance":
-        {{
-        "confidence_level": 0-100,
-        "intent": "check_balance",
-        "data": {{}}
-        }}
-
-        If intent is "bank_statement":
-        {{
-        "confidence_level": 0-100,
-        "intent": "bank_statement",
-        "data": {{}}
-        }}
-
-        If intent is "smalltalks":
-        {{
-        "confidence_level": 0-100,
-        "intent": "smalltalks",
-        "data": {{}}
-        }}
-        """
-
-        response = soParser(llm.invoke([HumanMessage(content=prompt)]).content)
-        print(response)
-        if response:
-            if response.get("intent") == "transfer":
-                receiverAccountNumber = response.get("data").get(
-                    "receiverAccountNumber", None
-                )
-                amount = response.get("data").get("amount", None)
-                return {
-                    "intent": response["intent"],
-                    "receiverAccountNumber": receiverAccountNumber,
-                    "amount": amount,
-                }
-            else:
-                return {"intent": response["intent"]}
+        routed = agents.fastIntent(state)
+        if routed:
+            return routed
+        prompt = [HumanMessage(content=intentPrompt(state["messages"][-1].content))]
+        answer = intentStream()
+        # stop reading as soon as the intent is enough to route on
+        with closing(getIntentLLM().stream(prompt)) as chunks:
+            for chunk in chunks:
+                if answer.feed(chunk):
+                    break
+        try:
+            return intentUpdate(answer.result())
+        except intentParseError as e:
+            return intentFailed(e)
+
+    @staticmethod
+    async def aintentAgent(state: AgentState) -> AgentState:
+        # the classifier embeds the message, which is CPU work
+        routed = await runBlocking(agents.fastIntent, state)
+        if routed:
+            return routed
+        prompt = [HumanMessage(content=intentPrompt(state["messages"][-1].content))]
+        answer = intentStream()
+        async with aclosing(getIntentLLM().astream(prompt)) as chunks:
+            async for chunk in chunks:
+                if answer.feed(chunk):
+                    break
+        try:
+            return intentUpdate(answer.result())
+        except intentParseError as e:
+            return intentFailed(e)
 
     @staticmethod
     def firstRouter(state: AgentState):
@@ -159,13 +268,28 @@ class agents:
 
     @staticmethod
     def nameValidator(state: AgentState) -> AgentState:
-        if state["intent"] == "transfer":
-            recipientData = userAccnts.find_one(
-                {"accountNumber": state["receiverAccountNumber"]}
-            )
-            recipientName = f"{recipientData.get('lastName', '')} {recipientData.get('firstName', '')}".strip()
-            response = f"You are about to transfer {state['amount']} to {recipientName}"
-            return {"messages": AIMessage(content=response)}
+        if state["intent"] != "transfer":
+            return {"recipientValid": True}
+        recipientData = userAccnts.find_one(
+            {"accountNumber": state.get("receiverAccountNumber")}
+        )
+        if recipientData is None:
+            # no OTP is generated or emailed for a recipient that does not exist
+            return {
+                "recipientValid": False,
+                "messages": [
+                    AIMessage(
+                        content=f"I could not find the account {state.get('receiverAccountNumber')}. Please check the account number and try again."
+                    )
+                ],
+            }
+        recipientName = f"{recipientData.get('lastName', '')} {recipientData.get('firstName', '')}".strip()
+        response = f"You are about to transfer {state['amount']} to {recipientName}"
+        return {"recipientValid": True, "messages": [AIMessage(content=response)]}
+
+    @staticmethod
+    def recipientRouter(state: AgentState):
+        return "valid" if state.get("recipientValid") else "invalid"
 
     @staticmethod
     def otpGenerator(state: AgentState) -> AgentState:
@@ -215,14 +339,96 @@ class agents:
             ]
         }
 
+    @staticmethod
+    def chatCache(state: dict):
+        """semantic-cache lookup for the turn, returns (cached update or None, lookup)
+        where lookup is what chatRemember needs to store the answer"""
+        messages = state.get("messages", [])
+        cache = getResponseCache()
+        humanTurns = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        query = messages[humanTurns[-1]].content if humanTurns else None
+        if not (cache and query):
+            return None, None
+        queryEmbedding = query_embeddings.embed(getNewsModel(), query)
+        # only at the start of a turn, not when coming back from the tools
+        if isinstance(messages[-1], HumanMessage):
+            scopes = ("global", f"account:{state.get('senderAccountNumber')}")
+            cached = cache.lookup(queryEmbedding, scopes)
+            if cached is not None:
+                return {"messages": [AIMessage(content=cached)]}, None
+        return None, (query, queryEmbedding, humanTurns[-1])
+
+    @staticmethod
+    def chatRemember(state: dict, lookup, response):
+        if lookup and not response.tool_calls and response.content:
+            query, queryEmbedding, turn = lookup
+            history = summaryMessage(state.get("summary")) + list(state["messages"][:turn])
+            scope = cacheScope(state, query, response.content, history)
+            getResponseCache().store(queryEmbedding, response.content, scope)
+
+    @staticmethod
+    def chatPrompt(state: dict):
+        "system prompt, running summary and the newest turns that fit in CHAT_TOKEN_BUDGET"
+        _, recent = splitHistory(state.get("messages", []), CHAT_TOKEN_BUDGET)
+        return [SYSTEM_PROMPT] + summaryMessage(state.get("summary")) + recent
+
     @staticmethod
     def chat(state: dict):
+        cached, lookup = agents.chatCache(state)
+        if cached:
+            return cached
+        full_messages = agents.chatPrompt(state)
+        response = getChatLLM().invoke(full_messages)
+        agents.chatRemember(state, lookup, response)
+        # add_messages appends it, returning the history too would only be deduplicated
+        return {"messages": [response]}
+
+    @staticmethod
+    async def achat(state: dict):
+        cached, lookup = await runBlocking(agents.chatCache, state)
+        if cached:
+            return cached
+        full_messages = agents.chatPrompt(state)
+        response = await getChatLLM().ainvoke(full_messages)
+        agents.chatRemember(state, lookup, response)
+        return {"messages": [response]}
+
+    @staticmethod
+    def compactable(state: dict):
+        "the messages to fold into the summary, None while the thread is within budget"
         messages = state.get("messages", [])
-        full_messages = [SYSTEM_PROMPT] + messages
-        response = chat_llm.invoke(full_messages)
-        updated_messages = messages + [response]  # Just use response directly
+        if countTokens(messages) <= CHAT_TOKEN_BUDGET:
+            return None
+        older, _ = splitHistory(messages, CHAT_KEEP_TOKENS)
+        return older or None
+
+    @staticmethod
+    def compacted(older, summary):
+        return {"summary": summary, "messages": [RemoveMessage(id=m.id) for m in older]}
 
-        return {"messages": updated_messages}
+    @staticmethod
+    def compact(state: dict):
+        older = agents.compactable(state)
+        if not older:
+            return None
+        summary = state.get("summary")
+        if CHAT_SUMMARY:
+            prompt = summaryPrompt(summary, older)
+            response = getLLM().invoke(prompt, config=SUMMARY_CONFIG)
+            summary = response.content
+        return agents.compacted(older, summary)
+
+    @staticmethod
+    async def acompact(state: dict):
+        older = agents.compactable(state)
+        if not older:
+            return None
+        summary = state.get("summary")
+        if CHAT_SUMMARY:
+            prompt = summaryPrompt(summary, older)
+            response = await getLLM().ainvoke(prompt, config=SUMMARY_CONFIG)
+            summary = response.content
+        return agents.compacted(older, summary)
 
     @staticmethod
     def process(state: AgentState) -> AgentState:
@@ -265,12 +471,16 @@ class agents:
         return "invalid"
 
     @staticmethod
-    def compileGraph():
+    def compileGraph(checkpointer=None):
+        "checkpointer defaults to the MongoDBSaver, benchmarks pass an in-memory one"
         builder = StateGraph(AgentState)
 
-        builder.add_node("intent", agents.intentAgent)
-        builder.add_node("chat", agents.chat)
+        # the LLM nodes have native async versions for ainvoke/astream, every other
+        # node is sync and LangGraph runs it on the loop's (bounded) default executor
+        builder.add_node("intent", RunnableLambda(agents.intentAgent, afunc=agents.aintentAgent))
+        builder.add_node("chat", RunnableLambda(agents.chat, afunc=agents.achat))
         builder.add_node("tools", toolnode)
+        builder.add_node("compact", RunnableLambda(agents.compact, afunc=agents.acompact))
 
         builder.add_node("nameValidator", agents.nameValidator)
         builder.add_node("otpgen", agents.otpGenerator)
@@ -284,10 +494,14 @@ class agents:
             "intent", agents.firstRouter, {"secure": "nameValidator", "chat": "chat"}
         )
 
-        builder.add_conditional_edges("chat", tools_condition)
+        builder.add_conditional_edges("chat", tools_condition, {"tools": "tools", END: "compact"})
         builder.add_edge("tools", "chat")
+        builder.add_edge("compact", END)
 
-        builder.add_edge("nameValidator", "otpgen")
+        # the OTP is only generated once the recipient is known to exist
+        builder.add_conditional_edges(
+            "nameValidator", agents.recipientRouter, {"valid": "otpgen", "invalid": END}
+        )
         builder.add_edge("otpgen", "otpinput")
         builder.add_edge("otpinput", "otpvalidator")
 
@@ -304,7 +518,7 @@ class agents:
         )
 
         builder.add_edge("process", END)
-        return builder.compile(checkpointer=checkpointer)
+        return instrument(builder.compile(checkpointer=checkpointer or getCheckpointer()))
 
     @staticmethod
     def draw():
@@ -314,11 +528,22 @@ class agents:
             f.write(png_bytes)
 
 
+@lru_cache(maxsize=None)
+def getGraph():
+    return agents.compileGraph()
+
+
+def __getattr__(name):
+    # `compiled` used to be built at import time, keep it importable by name
+    if name == "compiled":
+        return getGraph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 # from pprint import pprint
-compiled = agents.compileGraph()
 #agents.draw() #
 # config = {"configurable": {"thread_id": "990"}}
-# response = compiled.invoke(
+# response = getGraph().invoke(
 #     {
 #         "messages": [
 #             HumanMessage(
@@ -1,56 +1,73 @@
 from langchain.tools import tool
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.document_loaders import PyPDFLoader
-from pymongo import MongoClient
+from rencie.db import getDatabase
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from functools import lru_cache
 import warnings
 import os
+import threading
+import tempfile
+import shutil
 from dotenv import load_dotenv
 import numpy as np
+from agent.embedcache import queryEmbeddingCache
 
 vectordbpath = os.path.join(os.getcwd(), "faissDB")
+# how serving processes open the FAQ store, see agent/faissstore.py
+faiss_mmap = os.getenv("FAISS_MMAP", "0") == "1"
+faiss_compression = os.getenv("FAISS_COMPRESSION") or None
+faiss_lazy_docstore = os.getenv("FAISS_LAZY_DOCSTORE", "0") == "1"
 warnings.filterwarnings("ignore")
 
 # load_dotenv(dotenv_path=r".\all.env")
 
-MONGO = os.getenv("MONGODB")
-client = MongoClient(MONGO)
-news_db = client["renci_db"]
-news_collection = news_db["finance_news"]
+# the model, the news collection and the news index are built on first use, importing
+# this module (and the graph that binds its tools) does not load torch or touch Mongo
+@lru_cache(maxsize=None)
+def getNewsModel():
+    from langchain_community.embeddings import HuggingFaceEmbeddings
 
-news_model = HuggingFaceEmbeddings(
+    return HuggingFaceEmbeddings(
         model_name="sentence-transformers/all-MiniLM-L6-v2",
         model_kwargs={"device": "cpu"})
 
-def cosine_similarity(a, b):
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+@lru_cache(maxsize=None)
+def getNewsCollection():
+    return getDatabase("renci_db", workload="news")["finance_news"]
+
+def getNewsIndex():
+    from agent.newsindex import getNewsIndex
+
+    return getNewsIndex()
+
+# every query embedding in this module goes through this cache
+query_embeddings = queryEmbeddingCache(
+    maxsize=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600")),
+)
+
+news_max_age_days = float(os.getenv("NEWS_MAX_AGE_DAYS", "0")) or None
+news_recency_weight = float(os.getenv("NEWS_RECENCY_WEIGHT", "0.05"))
 
 @tool
 def search_finance_news(query: str) -> str:
     """Search for the latest finance news articles relevant to the user's query. Use this when users ask about market news, stocks, crypto, economy, or financial events."""
     
-    query_embedding = news_model.embed_query(query)  # Already returns a list
-    
-    articles = list(news_collection.find(
-        {},
-        {"embedding": 1, "title": 1, "summary": 1, "link": 1, "published": 1}
-    ).sort("fetched_at", -1).limit(200))
-    
-    if not articles:
-        return "No finance news available at the moment."
-    
-    scored = []
-    for article in articles:
-        if "embedding" in article and article["embedding"]:
-            score = cosine_similarity(query_embedding, article["embedding"])
-            scored.append((score, article))
-    
-    scored.sort(key=lambda x: x[0], reverse=True)
-    top_articles = scored[:5]
-    
+    query_embedding = query_embeddings.embed(getNewsModel(), query)
+
+    # the index is loaded and synced in the background (started by the API at startup,
+    # or here the first time), a query only searches what is indexed so far
+    news = getNewsIndex().start()
+    top_articles = news.search(
+        query_embedding,
+        k=5,
+        max_age_days=news_max_age_days,
+        recency_weight=news_recency_weight,
+    )
+
     if not top_articles:
-        return "No relevant finance news found for your query."
+        return "No finance news available at the moment."
     
     results = []
     for score, article in top_articles:
@@ -65,33 +82,104 @@ def search_finance_news(query: str) -> str:
     return "\n\n---\n\n".join(results)
 
 
+def saveVectorStore(store, db_path="faissDB"):
+    "writes the index next to db_path first and moves it in, so readers never load a half-written store"
+    from agent.faissstore import COMPRESSIONS, writeDerived
+
+    os.makedirs(db_path, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=db_path)
+    try:
+        store.save_local(staging)
+        derived = writeDerived(store, staging, faiss_compression)
+        for name in COMPRESSIONS:
+            stale = os.path.join(db_path, f"index.{name}.faiss")
+            if f"index.{name}.faiss" not in derived and os.path.exists(stale):
+                os.remove(stale)
+        # index.faiss goes last: its mtime is what faqRetriever watches
+        for name in derived + ["index.pkl", "index.faiss"]:
+            os.replace(os.path.join(staging, name), os.path.join(db_path, name))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+class faqRetriever:
+    "keeps one FAQ index per process and swaps to the new one whenever faissDB is rewritten"
+
+    def __init__(self, db_path=vectordbpath, embeddings=None):
+        self.db_path = db_path
+        self._embeddings = embeddings
+        self._lock = threading.Lock()
+        self._store = None
+        self._version = None
+
+    @property
+    def embeddings(self):
+        return self._embeddings or getNewsModel()
+
+    def diskVersion(self):
+        try:
+            return tuple(
+                os.stat(os.path.join(self.db_path, name)).st_mtime_ns
+                for name in ("index.faiss", "index.pkl")
+            )
+        except FileNotFoundError:
+            return None
+
+    def current(self):
+        store, version = self._store, self.diskVersion()
+        if store is not None and (version is None or version == self._version):
+            return store
+        with self._lock:
+            if self._store is None or (version is not None and version != self._version):
+                self._load()
+            return self._store
+
+    def reload(self):
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        from agent.faissstore import loadStore
+
+        while True:
+            version = self.diskVersion()
+            store = loadStore(
+                self.db_path,
+                self.embeddings,
+                mmap=faiss_mmap,
+                compression=faiss_compression,
+                lazy_docstore=faiss_lazy_docstore,
+            )
+            if self.diskVersion() == version:
+                break
+        # a single reference assignment, queries already holding the old store finish on it
+        self._store, self._version = store, version
+
+    def search(self, query, k=4):
+        return self.current().similarity_search_by_vector(
+            query_embeddings.embed(self.embeddings, query), k=k
+        )
+
+
+faq = faqRetriever()
+
+
 def vectorstorecreator(filepath, db_path="faissDB"):
     docs = PyPDFLoader(filepath).load()
     textsplitter = RecursiveCharacterTextSplitter(
         chunk_size=200, separators=["\n\n", "\n", " ", ""]
     )
     document_chunks = textsplitter.split_documents(docs)
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        model_kwargs={"device": "cpu"},
-    )
-    faiss_vector_database = FAISS.from_documents(document_chunks, embeddings)
-    faiss_vector_database.save_local(db_path)
+    faiss_vector_database = FAISS.from_documents(document_chunks, getNewsModel())
+    saveVectorStore(faiss_vector_database, db_path)
+    if os.path.abspath(db_path) == os.path.abspath(faq.db_path):
+        faq.reload()
 
 # vectorstorecreator(".\rencieFAQForRAG.pdf") # uncomment this to create a vector store to serve as a knowledge base for Rencie
 
 @tool
 def vectordbMemory(query):
     "this vector database tool should be used when the query of the user is about Renci FAQ"
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        model_kwargs={"device": "cpu"},
-    )
-    vector_store = FAISS.load_local(
-        vectordbpath, embeddings, allow_dangerous_deserialization=True
-    )
-    retriever = vector_store.as_retriever()
-    response = retriever.get_relevant_documents(query)
+    response = faq.search(query)
     context = "\n\n".join([doc.page_content for doc in response])
     return context
-
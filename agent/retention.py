@@ -0,0 +1,216 @@
+"""Retention for the LangGraph checkpoints MongoDBSaver keeps per account.
+
+thread_id is the account number, so without pruning a thread grows by a few
+checkpoints every chat turn, forever. A retention pass, per thread and namespace:
+
+- keeps the latest `keep` checkpoints and any checkpoint still waiting on an
+  interrupt (the OTP prompt), and deletes the rest with their writes
+- compacts writes: only the latest checkpoint and pending interrupts keep theirs,
+  older checkpoints' writes are already folded into the checkpoint after them
+- deletes the whole thread when its latest checkpoint is older than `idle_days`
+
+It only uses pymongo and the saver's collection layout: a checkpoint's age is
+read from its checkpoint_id, a uuid6 whose high bits are its creation time, so
+LangGraph is only imported for an id that is not one.
+
+A single process should run it, the scans cover the whole collection: the
+Celery beat task bank.pruneCheckpoints (every CHECKPOINT_RETENTION_INTERVAL) or
+`python -m agent.retention [--once]`. The API only runs it with
+CHECKPOINT_RETENTION=1.
+"""
+import argparse
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from prometheus_client import Counter
+
+RETENTION_DELETED = Counter(
+    "checkpoint_retention_deleted_total",
+    "Checkpoint and write documents removed by the retention job",
+    ["collection", "reason"],
+)
+
+RETENTION_BYTES = Counter(
+    "checkpoint_retention_bytes_reclaimed_total",
+    "BSON bytes of the documents removed by the retention job",
+    ["collection"],
+)
+
+INTERRUPT = "__interrupt__"
+
+
+# 100ns intervals between the UUID epoch (1582-10-15) and the Unix epoch
+UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+
+def checkpointIdTime(checkpoint_id):
+    "the creation time LangGraph's uuid6 checkpoint ids carry, None for any other id"
+    try:
+        value = uuid.UUID(str(checkpoint_id))
+    except ValueError:
+        return None
+    if value.version != 6:
+        return None
+    ticks = ((value.int >> 80) << 12) | ((value.int >> 64) & 0x0FFF)
+    return datetime.fromtimestamp((ticks - UUID_EPOCH_OFFSET) / 10**7, tz=timezone.utc)
+
+
+def checkpointTimestamp(doc):
+    "the checkpoint's ts, decoded with the saver's serializer"
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+    checkpoint = JsonPlusSerializer().loads_typed((doc["type"], doc["checkpoint"]))
+    return datetime.fromisoformat(checkpoint["ts"])
+
+
+class checkpointRetention:
+    def __init__(
+        self,
+        db,
+        keep=20,
+        idle_days=90,
+        interval=3600,
+        checkpoint_collection_name="checkpoints",
+        writes_collection_name="checkpoint_writes",
+    ):
+        self.checkpoints = db[checkpoint_collection_name]
+        self.writes = db[writes_collection_name]
+        self.keep = max(1, keep)
+        self.idle_days = idle_days
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _delete(self, collection, query, reason):
+        "deletes and counts the documents matching query, returns the bytes reclaimed"
+        size = list(
+            collection.aggregate(
+                [
+                    {"$match": query},
+                    {"$group": {"_id": None, "bytes": {"$sum": {"$bsonSize": "$$ROOT"}}}},
+                ]
+            )
+        )
+        reclaimed = size[0]["bytes"] if size else 0
+        deleted = collection.delete_many(query).deleted_count
+        if deleted:
+            RETENTION_DELETED.labels(collection=collection.name, reason=reason).inc(deleted)
+            RETENTION_BYTES.labels(collection=collection.name).inc(reclaimed)
+        return reclaimed
+
+    def pendingInterrupts(self, thread):
+        "checkpoints with an interrupt write that no later checkpoint has resumed from"
+        interrupted = self.writes.distinct("checkpoint_id", {**thread, "channel": INTERRUPT})
+        if not interrupted:
+            return set()
+        resumed = self.checkpoints.distinct(
+            "parent_checkpoint_id", {**thread, "parent_checkpoint_id": {"$in": interrupted}}
+        )
+        return set(interrupted) - set(resumed)
+
+    def latestTime(self, thread, latest):
+        created = checkpointIdTime(latest["checkpoint_id"])
+        if created is None:
+            doc = self.checkpoints.find_one(
+                {**thread, "checkpoint_id": latest["checkpoint_id"]}, {"type": 1, "checkpoint": 1}
+            )
+            created = checkpointTimestamp(doc)
+        return created
+
+    def pruneThread(self, thread_id, checkpoint_ns, now):
+        thread = {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}
+        latest = list(
+            self.checkpoints.find(thread, {"checkpoint_id": 1}).sort("checkpoint_id", -1).limit(1)
+        )
+        if not latest:
+            return 0
+
+        # checkpoint ids sort by creation time; bounding every delete by the newest id
+        # seen here leaves alone anything a chat turn writes while the pass runs
+        upTo = {"$lte": latest[0]["checkpoint_id"]}
+        if self.idle_days and self.latestTime(thread, latest[0]) < now - timedelta(days=self.idle_days):
+            idle = {**thread, "checkpoint_id": upTo}
+            return self._delete(self.checkpoints, idle, "idle") + self._delete(
+                self.writes, idle, "idle"
+            )
+
+        recent = [
+            doc["checkpoint_id"]
+            for doc in self.checkpoints.find(thread, {"checkpoint_id": 1})
+            .sort("checkpoint_id", -1)
+            .limit(self.keep)
+        ]
+        pending = self.pendingInterrupts(thread)
+        kept = set(recent) | pending
+        reclaimed = self._delete(
+            self.checkpoints, {**thread, "checkpoint_id": {**upTo, "$nin": list(kept)}}, "retention"
+        )
+        # covers the writes of the checkpoints just deleted as well
+        withWrites = {recent[0]} | pending
+        reclaimed += self._delete(
+            self.writes, {**thread, "checkpoint_id": {**upTo, "$nin": list(withWrites)}}, "compaction"
+        )
+        return reclaimed
+
+    def runOnce(self):
+        "one pass over every thread, returns the bytes reclaimed"
+        now = datetime.now(timezone.utc)
+        threads = self.checkpoints.aggregate(
+            [{"$group": {"_id": {"thread_id": "$thread_id", "checkpoint_ns": "$checkpoint_ns"}}}],
+            allowDiskUse=True,
+        )
+        reclaimed = 0
+        for thread in threads:
+            if self._stop.is_set():
+                break
+            try:
+                reclaimed += self.pruneThread(thread["_id"]["thread_id"], thread["_id"]["checkpoint_ns"], now)
+            except Exception as e:
+                print(f"checkpoint retention failed for thread {thread['_id']}: {e}")
+        return reclaimed
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.runOnce()
+            except Exception as e:
+                print(f"checkpoint retention pass failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="checkpoint-retention", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def fromEnv():
+    "the retention job configured by CHECKPOINT_KEEP, CHECKPOINT_IDLE_DAYS and CHECKPOINT_RETENTION_INTERVAL"
+    from rencie.db import getDatabase
+
+    return checkpointRetention(
+        getDatabase("my_database", workload="checkpoints"),
+        keep=int(os.getenv("CHECKPOINT_KEEP", "20")),
+        idle_days=float(os.getenv("CHECKPOINT_IDLE_DAYS", "90")),
+        interval=float(os.getenv("CHECKPOINT_RETENTION_INTERVAL", "3600")),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="prunes the chat checkpoints (see the module docstring)")
+    parser.add_argument("--once", action="store_true", help="one pass, then exit")
+    args = parser.parse_args()
+
+    retention = fromEnv()
+    if args.once:
+        print(f"reclaimed {retention.runOnce()} bytes")
+    else:
+        retention._loop()
@@ -0,0 +1,95 @@
+import re
+import threading
+import time
+import numpy as np
+from prometheus_client import Counter
+
+SEMANTIC_CACHE_HITS = Counter(
+    "chat_semantic_cache_hits_total",
+    "Chat answers served from the semantic cache",
+    ["scope"],
+)
+
+SEMANTIC_CACHE_MISSES = Counter(
+    "chat_semantic_cache_misses_total",
+    "Chat turns that had to call the LLM",
+)
+
+
+def cacheScope(state, query, answer, history=()):
+    """'global' unless the turn carries something only this account should see.
+
+    that is the account holder's name, email or account number in the query or answer,
+    or a number in the answer that came from earlier in the conversation (a balance,
+    an amount, a transaction id)
+    """
+    account = state.get("senderAccountNumber")
+    private = f"account:{account}"
+    text = f"{query}\n{answer}".lower()
+    for value in (account, state.get("name"), state.get("email")):
+        if value and str(value).lower() in text:
+            return private
+    earlier = " ".join(str(message.content) for message in history)
+    if any(number in earlier for number in re.findall(r"\d[\d,.]{2,}", answer)):
+        return private
+    return "global"
+
+
+class semanticCache:
+    "answers keyed on the unit-length query embedding, a lookup hits when cosine similarity >= threshold"
+
+    def __init__(self, threshold=0.95, maxsize=1000, ttl=900):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._vectors = None  # (maxsize, dim), one row per slot
+        self._slots = []  # [scope, answer, expiresAt, lastUsed] or None when free
+
+    def _unit(self, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding, scopes):
+        query = self._unit(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None or not self._slots:
+                SEMANTIC_CACHE_MISSES.inc()
+                return None
+            scores = self._vectors[: len(self._slots)] @ query
+            for slot in np.argsort(-scores):
+                if scores[slot] < self.threshold:
+                    break
+                entry = self._slots[slot]
+                if entry and entry[0] in scopes and entry[2] > now:
+                    entry[3] = now
+                    SEMANTIC_CACHE_HITS.labels(scope=entry[0].split(":")[0]).inc()
+                    return entry[1]
+        SEMANTIC_CACHE_MISSES.inc()
+        return None
+
+    def store(self, embedding, answer, scope):
+        vector = self._unit(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, len(vector)), dtype=np.float32)
+            slot = self._freeSlot(now)
+            self._vectors[slot] = vector
+            self._slots[slot] = [scope, answer, now + self.ttl, now]
+
+    def _freeSlot(self, now):
+        "an empty or expired slot, else the least recently used one"
+        for slot, entry in enumerate(self._slots):
+            if entry is None or entry[2] <= now:
+                return slot
+        if len(self._slots) < self.maxsize:
+            self._slots.append(None)
+            return len(self._slots) - 1
+        return min(range(len(self._slots)), key=lambda slot: self._slots[slot][3])
+
+    def clear(self):
+        with self._lock:
+            self._slots = []
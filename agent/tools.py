@@ -1,36 +1,76 @@
-import re, json
-
-
-def soParser(text: str):
-    text = text.strip()
-
-    def clean_json_string(match):
-        return match.group(0).replace("\n", " ").replace("\r", "")
-
-    try:
-        pattern = r"```(?:json)?\s*(\{.*?\})\s*```"
-        match = re.search(pattern, text, re.DOTALL)
-        if match:
-            json_text = match.group(1).strip()
-            json_text = re.sub(r'"[^"]*"', clean_json_string, json_text)
-            return json.loads(json_text)
-    except Exception as e:
-        pass
-    try:
-        if text.startswith("{") and text.endswith("}"):
-            cleaned_text = re.sub(r'"[^"]*"', clean_json_string, text)
-            return json.loads(cleaned_text)
-    except Exception as e:
-        pass
-    try:
-        pattern = r"(\{.*\})"
-        match = re.search(pattern, text, re.DOTALL)
-        if match:
-            json_text = match.group(1).strip()
-            json_text = re.sub(r'"[^"]*"', clean_json_string, json_text)
-            return json.loads(json_text)
-    except Exception as e:
-        pass
-    return {
-        "error": "Failed to parse JSON from the response.",
-    }
+import re
+from typing import Literal, Optional
+from langchain_core.messages import AIMessageChunk
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from prometheus_client import Counter
+
+INTENT_PARSE_FAILURES = Counter(
+    "intent_parse_failures_total",
+    "Intent LLM answers that did not match intentPayload, routed to chat instead",
+)
+
+
+class intentPayload(BaseModel):
+    """Record the intent of the user's banking message and the data it carries.
+    Leave a field null when the message does not state it, never guess."""
+
+    # intent is declared first so it is the first value in the streamed arguments
+    intent: Literal["transfer", "check_balance", "bank_statement", "smalltalks"] = Field(
+        description="transfer: send money to another account. check_balance: know their "
+        "account balance. bank_statement: get a transaction/bank statement. smalltalks: "
+        "greetings, casual chat, questions or anything else"
+    )
+    receiverAccountNumber: Optional[str] = Field(
+        default=None, description="transfer only: the recipient's account number, as written"
+    )
+    amount: Optional[int] = Field(default=None, description="transfer only: the amount, as an integer")
+
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+
+class intentParseError(ValueError):
+    "the intent LLM did not answer with a valid intentPayload call"
+
+
+class intentStream:
+    """Accumulates the intentPayload arguments of a streamed tool call.
+
+    feed() returns True once the answer is enough to route on: as soon as the
+    `intent` value is closed for everything but transfers, which also need the
+    account number and amount, so they wait for the whole call.
+    """
+
+    INTENT = re.compile(r'"intent"\s*:\s*"([^"]*)"')
+
+    def __init__(self):
+        self.arguments = ""
+        self.called = None
+        self.intent = None
+
+    def feed(self, message) -> bool:
+        if isinstance(message, AIMessageChunk):
+            for call in message.tool_call_chunks:
+                self.arguments += call.get("args") or ""
+        else:
+            # a model without streaming support answers with one complete message
+            for call in message.tool_calls:
+                self.called = call["args"]
+        if self.intent is None:
+            if self.called is not None:
+                self.intent = self.called.get("intent")
+            else:
+                match = self.INTENT.search(self.arguments)
+                self.intent = match.group(1) if match else None
+        return self.intent is not None and self.intent != "transfer"
+
+    def result(self) -> intentPayload:
+        try:
+            if self.intent is not None and self.intent != "transfer":
+                return intentPayload(intent=self.intent)
+            if self.called is not None:
+                return intentPayload.model_validate(self.called)
+            if not self.arguments:
+                raise intentParseError("the intent LLM did not call intentPayload")
+            return intentPayload.model_validate_json(self.arguments)
+        except ValidationError as e:
+            raise intentParseError(str(e)) from e
@@ -0,0 +1,106 @@
+"""A payroll batch paid with bank.bulkTransfer against the same batch paid with one
+bank.transferMoney call per recipient (what /api/v1/transfer does).
+
+Runs offline on benchmarks/fakes.py's collections. Every MongoDB call sleeps
+--mongo-ms and every Resend call --email-ms, so the report shows where the
+round trips go: time to the response, transfers/s, MongoDB calls and Resend
+calls for each path.
+
+usage: python -m benchmarks.bulk_transfer [--recipients 1000] [--mongo-ms 1] [--email-ms 50]
+                                          [--chunk-size 250]
+"""
+import argparse
+import time
+
+SENDER = "9876543210"
+
+
+def accounts(recipients):
+    docs = [
+        {
+            "accountNumber": SENDER,
+            "firstName": "Payroll",
+            "lastName": "Ltd",
+            "emailAddress": "payroll@example.com",
+            "accountBalance": 10**12,
+        }
+    ]
+    for n in range(recipients):
+        docs.append(
+            {
+                "accountNumber": str(1000000000 + n),
+                "firstName": f"Staff{n}",
+                "lastName": "Member",
+                "emailAddress": f"staff{n}@example.com",
+                "accountBalance": 0,
+            }
+        )
+    return docs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=1000)
+    parser.add_argument("--mongo-ms", type=float, default=1)
+    parser.add_argument("--email-ms", type=float, default=50)
+    parser.add_argument("--chunk-size", type=int, default=250)
+    args = parser.parse_args()
+
+    import rencie.logic as logic
+    import rencie.transfers as transfers
+    from benchmarks.fakes import memoryClient, memoryCollection
+
+    transfers.BULK_TRANSFER_CHUNK_SIZE = args.chunk_size
+    resendCalls = []
+
+    def sendEmail(subject="", body="", to=""):
+        resendCalls.append(1)
+        time.sleep(args.email_ms / 1000)
+        return {"status": "successful", "response": f"email send to {to}"}
+
+    def sendEmailBatch(emails):
+        resendCalls.append(1)
+        time.sleep(args.email_ms / 1000)
+        return {"status": "successful", "response": f"{len(emails)} emails sent"}
+
+    logic.bank.send_email = sendEmail
+    logic.bank.send_email_batch = sendEmailBatch
+    payroll = [
+        {"receipientAccntNumber": str(1000000000 + n), "amount": 1000 + n}
+        for n in range(args.recipients)
+    ]
+
+    def fresh():
+        logic.client = memoryClient()
+        logic.userAccnts = memoryCollection(accounts(args.recipients), args.mongo_ms / 1000, "accountInfo")
+        logic.transactions = memoryCollection((), args.mongo_ms / 1000, "Transactions")
+        resendCalls.clear()
+
+    def perTransfer():
+        results = [
+            logic.bank.transferMoney(SENDER, item["receipientAccntNumber"], item["amount"], "Payroll")
+            for item in payroll
+        ]
+        return sum(result["status"] == "success" for result in results)
+
+    def bulk():
+        result = logic.bank.bulkTransfer(SENDER, "Payroll", payroll)
+        return sum(item["status"] == "successful" for item in result["transfers"])
+
+    rows = []
+    for name, run in (("per-transfer", perTransfer), ("bulk", bulk)):
+        fresh()
+        start = time.perf_counter()
+        paid = run()
+        elapsed = time.perf_counter() - start
+        # the bulk path sends its emails in the background, wait for them to count the calls
+        logic.emailPool.submit(lambda: None).result()
+        mongoCalls = logic.userAccnts.calls + logic.transactions.calls
+        ledger = len(logic.transactions.docs)
+        assert paid == ledger == args.recipients, f"{name}: {paid} paid, {ledger} ledger entries"
+        rows.append((name, elapsed, paid / elapsed, mongoCalls, len(resendCalls)))
+
+    print(f"{args.recipients} recipients, mongo={args.mongo_ms}ms email={args.email_ms}ms chunk={args.chunk_size}")
+    print(f"{'path':<14} {'response s':>10} {'transfers/s':>12} {'mongo calls':>12} {'resend calls':>13}")
+    for name, elapsed, rate, mongoCalls, resend in rows:
+        print(f"{name:<14} {elapsed:>10.2f} {rate:>12.0f} {mongoCalls:>12} {resend:>13}")
@@ -0,0 +1,401 @@
+"""Offline stand-ins for the services the agent graph talks to.
+
+- memoryCollection / memoryClient: the subset of pymongo the banking code uses,
+  in memory, with an optional sleep per call to model the round trip. Writes in
+  a memorySession transaction take the document until commit or abort, and a
+  second transaction writing it gets MongoDB's WriteConflict
+- scriptedChatModel: a deterministic chat model with configurable latency
+- offline(): points agent.process and rencie.logic at the stand-ins
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+
+# every write to a memoryCollection (and the transaction bookkeeping) holds this
+writeLock = threading.RLock()
+
+
+def lookup(doc, path):
+    for key in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(key)
+    return doc
+
+
+def matches(doc, query):
+    for path, expected in query.items():
+        if path == "$or":
+            if not any(matches(doc, branch) for branch in expected):
+                return False
+            continue
+        value = lookup(doc, path)
+        if isinstance(expected, dict) and any(key.startswith("$") for key in expected):
+            for op, operand in expected.items():
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$gte" and (value is None or value < operand):
+                    return False
+                if op == "$lte" and (value is None or value > operand):
+                    return False
+                if op == "$lt" and (value is None or value >= operand):
+                    return False
+                if op == "$exists" and (value is not None) != operand:
+                    return False
+        elif value != expected:
+            return False
+    return True
+
+
+def applyUpdate(doc, update):
+    for key, amount in update.get("$inc", {}).items():
+        doc[key] = doc.get(key, 0) + amount
+    doc.update(update.get("$set", {}))
+
+
+def accumulate(docs, accumulator):
+    (op, operand), = accumulator.items()
+    values = [operand if not isinstance(operand, str) else lookup(doc, operand[1:]) for doc in docs]
+    if op == "$sum":
+        return sum(value or 0 for value in values)
+    if op == "$addToSet":
+        return list(dict.fromkeys(value for value in values if value is not None))
+    raise NotImplementedError(op)
+
+
+def runPipeline(docs, pipeline):
+    "$match, $facet and $group on _id None, the stages the statement uses"
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            docs = [doc for doc in docs if matches(doc, spec)]
+        elif name == "$facet":
+            docs = [{facet: runPipeline(docs, stages) for facet, stages in spec.items()}]
+        elif name == "$group" and spec["_id"] is None:
+            fields = {key: accumulate(docs, value) for key, value in spec.items() if key != "_id"}
+            docs = [{"_id": None, **fields}] if docs else []
+        else:
+            raise NotImplementedError(name)
+    return docs
+
+
+def inTransaction(session):
+    return session is not None and getattr(session, "in_transaction", False)
+
+
+class memoryCollection:
+    """find/find_one/aggregate/insert_one/insert_many/update_one/find_one_and_update/
+    bulk_write (UpdateOne)/delete_one over a list of dicts, each call sleeping `latency` seconds.
+    `calls` counts the round trips"""
+
+    def __init__(self, docs=(), latency=0.0, name="collection"):
+        self.docs = [dict(doc) for doc in docs]
+        self.latency = latency
+        self.name = name
+        self.calls = 0
+
+    def _wait(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def find_one(self, query=None, *args, **kwargs):
+        self._wait()
+        return next((dict(doc) for doc in self.docs if matches(doc, query or {})), None)
+
+    def find(self, query=None, *args, **kwargs):
+        self._wait()
+        return iter([dict(doc) for doc in self.docs if matches(doc, query or {})])
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        self._wait()
+        return iter(runPipeline([dict(doc) for doc in self.docs], pipeline))
+
+    def insert_one(self, doc, *args, session=None, **kwargs):
+        self._wait()
+        doc.setdefault("_id", uuid.uuid4().hex)
+        stored = dict(doc)
+        with writeLock:
+            self.docs.append(stored)
+            if inTransaction(session):
+                session.inserted(self, stored)
+        return SimpleNamespace(inserted_id=doc["_id"], acknowledged=True)
+
+    def insert_many(self, docs, *args, session=None, **kwargs):
+        self._wait()
+        ids = []
+        with writeLock:
+            for doc in docs:
+                doc.setdefault("_id", uuid.uuid4().hex)
+                stored = dict(doc)
+                self.docs.append(stored)
+                if inTransaction(session):
+                    session.inserted(self, stored)
+                ids.append(doc["_id"])
+        return SimpleNamespace(inserted_ids=ids, acknowledged=True)
+
+    def bulk_write(self, requests, *args, session=None, **kwargs):
+        self._wait()
+        matched = 0
+        for request in requests:
+            # UpdateOne keeps its filter and update in these attributes
+            if self._update(request._filter, request._doc, session) is not None:
+                matched += 1
+        return SimpleNamespace(matched_count=matched, modified_count=matched, acknowledged=True)
+
+    def _update(self, query, update, session):
+        "(matched document after the update, or None)"
+        with writeLock:
+            for doc in self.docs:
+                if matches(doc, query):
+                    if inTransaction(session):
+                        session.take(doc)
+                    applyUpdate(doc, update)
+                    return doc
+        return None
+
+    def update_one(self, query, update, *args, session=None, **kwargs):
+        self._wait()
+        matched = 1 if self._update(query, update, session) is not None else 0
+        return SimpleNamespace(matched_count=matched, modified_count=matched)
+
+    def find_one_and_update(self, query, update, *args, session=None, return_document=ReturnDocument.BEFORE, **kwargs):
+        self._wait()
+        if return_document == ReturnDocument.BEFORE:
+            before = next((dict(doc) for doc in self.docs if matches(doc, query)), None)
+            return before if self._update(query, update, session) is not None else None
+        doc = self._update(query, update, session)
+        return dict(doc) if doc is not None else None
+
+    def delete_one(self, query, *args, **kwargs):
+        self._wait()
+        with writeLock:
+            for position, doc in enumerate(self.docs):
+                if matches(doc, query):
+                    del self.docs[position]
+                    return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+
+def writeConflict():
+    return OperationFailure(
+        "WriteConflict error: this operation conflicted with another operation",
+        112,
+        {"errorLabels": ["TransientTransactionError"], "code": 112, "codeName": "WriteConflict"},
+    )
+
+
+class memorySession:
+    """a session whose transaction owns the documents it wrote until commit or abort.
+    A write to a document owned by another transaction fails at once, as MongoDB's
+    does, and abort restores the documents and removes the inserts"""
+
+    def __init__(self, owners):
+        self.owners = owners
+        self.in_transaction = False
+        self._undo = []
+
+    def take(self, doc):
+        owner = self.owners.get(id(doc))
+        if owner is not None and owner is not self:
+            raise writeConflict()
+        if owner is None:
+            self.owners[id(doc)] = self
+            self._undo.append((doc, dict(doc)))
+
+    def inserted(self, collection, doc):
+        self._undo.append((collection, doc))
+
+    @contextmanager
+    def _transaction(self):
+        try:
+            yield
+        except BaseException:
+            if self.in_transaction:
+                self.abort_transaction()
+            raise
+        if self.in_transaction:
+            self.commit_transaction()
+
+    def start_transaction(self, *args, **kwargs):
+        self.in_transaction = True
+        self._undo = []
+        return self._transaction()
+
+    def _release(self):
+        for target, _ in self._undo:
+            if self.owners.get(id(target)) is self:
+                del self.owners[id(target)]
+        self._undo = []
+        self.in_transaction = False
+
+    def commit_transaction(self):
+        with writeLock:
+            self._release()
+
+    def abort_transaction(self):
+        with writeLock:
+            for target, saved in reversed(self._undo):
+                if isinstance(target, memoryCollection):
+                    target.docs = [doc for doc in target.docs if doc is not saved]
+                else:
+                    target.clear()
+                    target.update(saved)
+            self._release()
+
+
+class memoryClient:
+    "start_session() for code that wraps its writes in a transaction"
+
+    def __init__(self):
+        self.owners = {}
+
+    @contextmanager
+    def start_session(self, *args, **kwargs):
+        session = memorySession(self.owners)
+        try:
+            yield session
+        finally:
+            if session.in_transaction:
+                session.abort_transaction()
+
+
+class scriptedChatModel(BaseChatModel):
+    """answers the intent prompt with an intentPayload call from `intents` (message ->
+    arguments), asks for the tool named in `tools` (message -> tool) on a chat turn,
+    and otherwise replies with a short canned answer, sleeping `latency` seconds per
+    call. stream() sends tool call arguments and content a few characters at a time"""
+
+    intents: dict = {}
+    tools: dict = {}
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def reply(self, messages):
+        last = messages[-1]
+        if isinstance(last, HumanMessage) and "intent classifier" in last.content:
+            message = re.search(r"User message:\s*(.*?)\s*---", last.content, re.S).group(1)
+            arguments = self.intents.get(message, {"intent": "smalltalks"})
+            return AIMessage(
+                content="",
+                tool_calls=[{"name": "intentPayload", "args": arguments, "id": uuid.uuid4().hex}],
+            )
+        if isinstance(last, HumanMessage) and "running summary" in last.content:
+            return AIMessage(content="The customer chatted with Rencie.")
+        if isinstance(last, ToolMessage):
+            return AIMessage(content=f"From the FAQ: {last.content[:80]}")
+        human = next(m for m in reversed(messages) if isinstance(m, HumanMessage))
+        tool = self.tools.get(human.content)
+        if tool:
+            return AIMessage(
+                content="",
+                tool_calls=[{"name": tool, "args": {"query": human.content}, "id": uuid.uuid4().hex}],
+            )
+        return AIMessage(content=f"Happy to help with: {human.content}")
+
+    def _result(self, messages):
+        message = self.reply(messages)
+        prompt = sum(len(str(m.content)) for m in messages) // 4
+        message.usage_metadata = {
+            "input_tokens": prompt,
+            "output_tokens": len(message.content) // 4,
+            "total_tokens": prompt + len(message.content) // 4,
+        }
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+    def _chunks(self, messages, size=8):
+        message = self._result(messages).generations[0].message
+        for call in message.tool_calls:
+            arguments = json.dumps(call["args"])
+            for start in range(0, len(arguments), size):
+                first = start == 0
+                yield AIMessageChunk(
+                    content="",
+                    tool_call_chunks=[{
+                        "name": call["name"] if first else None,
+                        "args": arguments[start:start + size],
+                        "id": call["id"] if first else None,
+                        "index": 0,
+                    }],
+                )
+        for start in range(0, len(message.content), size):
+            yield AIMessageChunk(content=message.content[start:start + size])
+        yield AIMessageChunk(content="", usage_metadata=message.usage_metadata)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            yield ChatGenerationChunk(message=chunk)
+
+
+class fakeRetriever:
+    "stands in for agent.ragsystem.faq"
+
+    def search(self, query, k=4):
+        from langchain_core.documents import Document
+
+        return [Document(page_content=f"Rencie FAQ answer {n} about {query}") for n in range(k)]
+
+
+def offline(accounts, llm, mongo_latency=0.0):
+    """points the graph's modules at in-memory collections, a no-op email sender, the
+    scripted model and the fake FAQ retriever. returns the collections by name"""
+    import agent.process as process
+    import agent.ragsystem as ragsystem
+    import rencie.logic as logic
+
+    collections = {
+        "userAccnts": memoryCollection(accounts, mongo_latency, "accountInfo"),
+        "transactions": memoryCollection((), mongo_latency, "Transactions"),
+        "otp": memoryCollection((), mongo_latency, "OTP"),
+    }
+    # the nodes reach the collections through both modules' globals
+    for module in (process, logic):
+        for name, collection in collections.items():
+            setattr(module, name, collection)
+        module.client = memoryClient()
+    logic.bank.send_email = lambda subject="", body="", to="": {
+        "status": "successful",
+        "response": f"email send to {to}",
+    }
+    ragsystem.faq = fakeRetriever()
+    process.groqModel = lambda: llm
+    process.geminiModel = lambda: None
+    process.getLLM.cache_clear()
+    process.getIntentLLM.cache_clear()
+    process.getChatLLM.cache_clear()
+    return collections
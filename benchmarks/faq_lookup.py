@@ -0,0 +1,65 @@
+"""Cold vs warm latency of the vectordbMemory FAQ lookup.
+
+cold: what the tool used to do on every call (load the embedding model and faissDB, then search)
+warm: the process-wide faqRetriever that keeps both in memory
+
+usage: python -m benchmarks.faq_lookup --runs 20
+"""
+import argparse
+import statistics
+import time
+
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_community.vectorstores import FAISS
+
+from agent.ragsystem import faq, vectordbpath
+
+QUERIES = [
+    "how do I reset my password",
+    "how long does a transfer take",
+    "what is rencie",
+    "how do I open an account",
+]
+
+
+def coldLookup(query):
+    embeddings = HuggingFaceEmbeddings(
+        model_name="sentence-transformers/all-MiniLM-L6-v2",
+        model_kwargs={"device": "cpu"},
+    )
+    store = FAISS.load_local(
+        vectordbpath, embeddings, allow_dangerous_deserialization=True
+    )
+    return store.similarity_search(query, k=4)
+
+
+def warmLookup(query):
+    return faq.search(query)
+
+
+def timeit(fn, runs):
+    samples = []
+    for i in range(runs):
+        start = time.perf_counter()
+        fn(QUERIES[i % len(QUERIES)])
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(
+        f"{label:<6} runs={len(samples):<4} mean={statistics.mean(samples):9.2f}ms "
+        f"p50={statistics.median(samples):9.2f}ms p95={p95:9.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    faq.current()  # first load is paid once per process, outside the timed loop
+    report("cold", timeit(coldLookup, args.runs))
+    report("warm", timeit(warmLookup, args.runs))
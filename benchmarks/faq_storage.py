@@ -0,0 +1,80 @@
+"""Index size, recall@k and per-process private memory for the FAQ store formats.
+
+Builds a flat L2 index of synthetic 384-d vectors (or uses --db, an existing
+faissDB directory), writes the sq8 / pq variants with agent.faissstore and
+compares each against the exact index. Private RSS (RssAnon) is measured in a
+fresh process after opening the index with and without memory mapping.
+
+usage: python -m benchmarks.faq_storage --rows 100000 --queries 200
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+
+import faiss
+import numpy as np
+
+from agent.faissstore import COMPRESSIONS, compressIndex
+
+
+def privateRssMB():
+    with open("/proc/self/status") as f:
+        fields = dict(line.split(":", 1) for line in f)
+    return int(fields["RssAnon"].split()[0]) / 1024
+
+
+def openAndSearch(path, mmap, queries, results):
+    before = privateRssMB()
+    flags = 0
+    if mmap:
+        flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+    index = faiss.read_index(path, flags)
+    index.search(queries, 4)
+    results.put(privateRssMB() - before)
+
+
+def rssDelta(path, mmap, queries):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=openAndSearch, args=(path, mmap, queries, results))
+    process.start()
+    delta = results.get()
+    process.join()
+    return delta
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="an existing faissDB directory instead of synthetic vectors")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(3)
+    with tempfile.TemporaryDirectory() as directory:
+        if args.db:
+            exact = faiss.read_index(os.path.join(args.db, "index.faiss"))
+        else:
+            exact = faiss.IndexFlatL2(args.dim)
+            exact.add(rng.normal(size=(args.rows, args.dim)).astype(np.float32))
+        queries = exact.reconstruct_n(0, min(args.queries, exact.ntotal))
+        queries = queries + 0.1 * rng.normal(size=queries.shape).astype(np.float32)
+        _, truth = exact.search(queries, args.k)
+
+        variants = {"flat": exact}
+        for compression in COMPRESSIONS:
+            variants[compression] = compressIndex(exact, compression)
+
+        print(f"{'format':<6} {'size MB':>8} {'recall@' + str(args.k):>9} {'private MB':>11} {'mmap private MB':>16}")
+        for name, index in variants.items():
+            path = os.path.join(directory, f"{name}.faiss")
+            faiss.write_index(index, path)
+            _, found = index.search(queries, args.k)
+            recall = np.mean([len(set(t) & set(f)) / args.k for t, f in zip(truth, found)])
+            print(
+                f"{name:<6} {os.path.getsize(path) / 2**20:>8.1f} {recall:>9.3f} "
+                f"{rssDelta(path, False, queries):>11.1f} {rssDelta(path, True, queries):>16.1f}"
+            )
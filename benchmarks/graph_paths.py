@@ -0,0 +1,178 @@
+"""Latency and allocations of every path through the agent graph, fully offline.
+
+Replays scripted conversations against agents.compileGraph() with the scripted
+chat model, in-memory collections, a no-op email sender and a MemorySaver (see
+benchmarks/fakes.py). Each path is timed over --runs conversations, then replayed
+under tracemalloc for the bytes allocated per conversation.
+
+--baseline compares against a JSON file written by --write-baseline and exits 1
+when a path's p95 or allocations grow by more than the tolerances, so CI catches
+regressions in graph overhead.
+
+usage: python -m benchmarks.graph_paths [--runs 50] [--llm-ms 0] [--mongo-ms 0] [--async]
+                                        [--baseline FILE | --write-baseline FILE]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+
+import numpy as np
+
+os.environ.setdefault("FAST_INTENT_EMBEDDINGS", "0")
+os.environ.setdefault("SEMANTIC_CACHE", "0")
+
+SENDER = {
+    "accountNumber": "9876543210",
+    "firstName": "Ray",
+    "lastName": "Eze",
+    "emailAddress": "ray@example.com",
+    "accountBalance": 10**12,
+}
+RECIPIENT = {
+    "accountNumber": "0123456789",
+    "firstName": "Ada",
+    "lastName": "Obi",
+    "emailAddress": "ada@example.com",
+    "accountBalance": 0,
+}
+
+# each step is a user message, or "OTP" / "WRONG OTP" to answer the OTP interrupt
+PATHS = {
+    "smalltalk": ["hello"],
+    "llm_intent": ["tell me something about saving"],
+    "faq_tool": ["how do I reset my card pin"],
+    "check_balance": ["what is my balance", "OTP"],
+    "bank_statement": ["email me my account statement", "OTP"],
+    "transfer": ["send 5000 to 0123456789", "OTP"],
+    "transfer_otp_retry": ["send 5000 to 0123456789", "WRONG OTP", "OTP"],
+}
+
+LLM_INTENTS = {"tell me something about saving": {"intent": "smalltalks"}}
+TOOLS = {"how do I reset my card pin": "vectordbMemory"}
+
+
+def graphInput(step, collections):
+    from langchain_core.messages import HumanMessage
+    from langgraph.types import Command
+
+    if step in ("OTP", "WRONG OTP"):
+        latest = collections["otp"].docs[-1]["otp"]
+        return Command(resume=latest if step == "OTP" else str((int(latest) + 1) % 100000).zfill(5))
+    return {
+        "messages": [HumanMessage(content=step)],
+        "senderAccountNumber": SENDER["accountNumber"],
+        "name": SENDER["firstName"],
+        "email": SENDER["emailAddress"],
+    }
+
+
+def conversation(graph, steps, collections, loop=None):
+    "runs steps on a new thread, with ainvoke on loop when one is given"
+    config = {"configurable": {"thread_id": uuid.uuid4().hex}}
+    for step in steps:
+        payload = graphInput(step, collections)
+        if loop:
+            result = loop.run_until_complete(graph.ainvoke(payload, config=config))
+        else:
+            result = graph.invoke(payload, config=config)
+    if "__interrupt__" in result:
+        raise AssertionError(f"conversation {steps} ended waiting on an interrupt")
+    return result
+
+
+def percentiles(samples):
+    return {f"p{q}": float(np.percentile(samples, q)) for q in (50, 95, 99)}
+
+
+def compare(results, baseline, latency_tolerance, alloc_tolerance):
+    failures = []
+    for path, current in results.items():
+        previous = baseline.get(path)
+        if not previous:
+            continue
+        if current["p95"] > previous["p95"] * (1 + latency_tolerance):
+            failures.append(f"{path}: p95 {current['p95']:.2f}ms, baseline {previous['p95']:.2f}ms")
+        if current["alloc_kib"] > previous["alloc_kib"] * (1 + alloc_tolerance):
+            failures.append(
+                f"{path}: {current['alloc_kib']:.0f}KiB allocated, baseline {previous['alloc_kib']:.0f}KiB"
+            )
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--alloc-runs", type=int, default=10)
+    parser.add_argument("--llm-ms", type=float, default=0)
+    parser.add_argument("--mongo-ms", type=float, default=0)
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    parser.add_argument("--paths", nargs="+", default=list(PATHS))
+    parser.add_argument("--baseline")
+    parser.add_argument("--write-baseline")
+    parser.add_argument("--latency-tolerance", type=float, default=1.0)
+    parser.add_argument("--alloc-tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    from langgraph.checkpoint.memory import MemorySaver
+    import agent.process as process
+    from benchmarks.fakes import offline, scriptedChatModel
+
+    llm = scriptedChatModel(intents=LLM_INTENTS, tools=TOOLS, latency=args.llm_ms / 1000)
+    collections = offline([SENDER, RECIPIENT], llm, mongo_latency=args.mongo_ms / 1000)
+    graph = process.agents.compileGraph(checkpointer=MemorySaver())
+    loop = asyncio.new_event_loop() if args.use_async else None
+
+    # graph output goes through print() in a few nodes, keep the report readable
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    results = {}
+    try:
+        for path in args.paths:
+            steps = PATHS[path]
+            conversation(graph, steps, collections, loop)  # warm-up
+            latencies = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                conversation(graph, steps, collections, loop)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+            tracemalloc.start()
+            allocated = []
+            for _ in range(args.alloc_runs):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                conversation(graph, steps, collections, loop)
+                allocated.append(tracemalloc.get_traced_memory()[1] - before)
+            tracemalloc.stop()
+
+            results[path] = {
+                "turns": len(steps),
+                **percentiles(latencies),
+                "alloc_kib": float(np.median(allocated)) / 1024,
+            }
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    mode = "ainvoke" if args.use_async else "invoke"
+    print(f"{args.runs} runs per path, {mode}, llm={args.llm_ms}ms mongo={args.mongo_ms}ms")
+    print(f"{'path':<20} {'turns':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak KiB':>9}")
+    for path, row in results.items():
+        print(
+            f"{path:<20} {row['turns']:>5} {row['p50']:>8.2f} {row['p95']:>8.2f} "
+            f"{row['p99']:>8.2f} {row['alloc_kib']:>9.0f}"
+        )
+
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(results, json.load(f), args.latency_tolerance, args.alloc_tolerance)
+        for failure in failures:
+            print("REGRESSION", failure)
+        sys.exit(1 if failures else 0)
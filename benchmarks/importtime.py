@@ -0,0 +1,83 @@
+"""Import-time report and budget check for the API and Celery worker entry points.
+
+Imports each module in a fresh interpreter under `python -X importtime`, prints
+the slowest top-level imports and exits with status 1 when a module goes over
+its time budget or pulls in part of the AI stack, which must only load on first use.
+
+usage: python -m benchmarks.importtime [--budget fastapp=3.0 --budget rencie.logic=1.5]
+"""
+import argparse
+import subprocess
+import sys
+
+AI_STACK = (
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "faiss",
+    "langchain",
+    "langchain_core",
+    "langchain_community",
+    "langgraph",
+    "langchain_groq",
+)
+
+# seconds of cumulative import time allowed for each entry point
+BUDGETS = {
+    "fastapp": 3.0,
+    "rencie.logic": 1.5,
+}
+
+
+def importTimes(module):
+    "returns [(depth, module, self_us, cumulative_us)] for every import made by `import module`"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        selfUs, cumulativeUs, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((depth, name.strip(), int(selfUs), int(cumulativeUs)))
+    return rows
+
+
+def check(module, budget, top=10):
+    rows = importTimes(module)
+    total = next(cumulative for _, name, _, cumulative in reversed(rows) if name == module) / 1e6
+    loaded = {name.split(".")[0] for _, name, _, _ in rows}
+    leaked = sorted(loaded.intersection(AI_STACK))
+
+    print(f"\n{module}: {total:.2f}s (budget {budget:.2f}s), {len(rows)} modules imported")
+    topLevel = sorted((r for r in rows if r[0] <= 1 and r[1] != module), key=lambda r: -r[3])
+    for _, name, _, cumulative in topLevel[:top]:
+        print(f"  {cumulative / 1e3:9.1f}ms  {name}")
+
+    failures = []
+    if total > budget:
+        failures.append(f"{module} took {total:.2f}s to import, budget is {budget:.2f}s")
+    if leaked:
+        failures.append(f"{module} imports {', '.join(leaked)} at import time")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", action="append", default=[], help="module=seconds")
+    args = parser.parse_args()
+
+    budgets = dict(BUDGETS)
+    for override in args.budget:
+        module, seconds = override.split("=")
+        budgets[module] = float(seconds)
+
+    failures = [failure for module, budget in budgets.items() for failure in check(module, budget)]
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,67 @@
+"""Throughput (pages/sec) and peak RSS of the streaming ingestion pipeline.
+
+Each (pdf, workers) run happens in its own process so peak RSS is not carried
+over between runs. Without pdf arguments, hundred-page PDFs are synthesised by
+repeating the pages of agent/rencieFAQForRAG.pdf.
+
+usage: python -m benchmarks.ingestion --pages 100 300 --workers 0 2 4 [pdf ...]
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from pypdf import PdfReader, PdfWriter
+
+FAQ_PDF = os.path.join(os.path.dirname(__file__), "..", "agent", "rencieFAQForRAG.pdf")
+
+
+def synthesise(pages, directory):
+    source = PdfReader(FAQ_PDF)
+    writer = PdfWriter()
+    for i in range(pages):
+        writer.add_page(source.pages[i % len(source.pages)])
+    path = os.path.join(directory, f"synthetic-{pages}.pdf")
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+
+def run(pdf, workers, batch_size, results):
+    from agent.ingest import embedDocument, embeddingPool
+    from agent.ragsystem import getNewsModel
+
+    pool = embeddingPool(workers) if workers else None
+    if pool:
+        pool.executor().submit(int).result()  # start the workers outside the timed section
+    start = time.perf_counter()
+    _, pages, chunks = embedDocument(None, getNewsModel(), pdf, "bench", os.path.basename(pdf), pool, batch_size)
+    elapsed = time.perf_counter() - start
+    if pool:
+        pool.shutdown()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    results.put((os.path.basename(pdf), workers, pages, chunks, elapsed, peak / 1024))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 300])
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2])
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        pdfs = args.pdfs or [synthesise(pages, directory) for pages in args.pages]
+        print(f"{'pdf':<24} {'workers':>7} {'pages':>6} {'chunks':>7} {'pages/s':>8} {'peak RSS MB':>12}")
+        for pdf in pdfs:
+            for workers in args.workers:
+                results = context.Queue()
+                process = context.Process(target=run, args=(pdf, workers, args.batch_size, results))
+                process.start()
+                name, workers, pages, chunks, elapsed, peak = results.get()
+                process.join()
+                print(f"{name:<24} {workers:>7} {pages:>6} {chunks:>7} {pages / elapsed:>8.1f} {peak:>12.0f}")
@@ -0,0 +1,59 @@
+"""Coverage, accuracy and latency of the local intent classifier.
+
+Runs agent.intentclassifier over the labelled messages in
+benchmarks/data/intents.jsonl. Coverage is the share of messages routed without
+the LLM; accuracy is measured on those routed messages only.
+
+usage: python -m benchmarks.intent_classifier [--rules-only]
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+
+import numpy as np
+
+from agent.intentclassifier import INTENTS, intentClassifier
+
+LABELLED = os.path.join(os.path.dirname(__file__), "data", "intents.jsonl")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules-only", action="store_true")
+    parser.add_argument("--data", default=LABELLED)
+    args = parser.parse_args()
+
+    embed = None
+    if not args.rules_only:
+        from agent.ragsystem import getNewsModel, query_embeddings
+
+        model = getNewsModel()
+        embed = lambda text: query_embeddings.embed(model, text)
+    classifier = intentClassifier(embed=embed)
+    if embed:
+        classifier.centroids()  # built once per process, outside the timed loop
+
+    with open(args.data) as f:
+        labelled = [json.loads(line) for line in f if line.strip()]
+
+    routed, correct, latencies = Counter(), Counter(), []
+    totals = Counter(row["intent"] for row in labelled)
+    for row in labelled:
+        start = time.perf_counter()
+        result = classifier.classify(row["text"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        if result:
+            routed[row["intent"]] += 1
+            correct[row["intent"]] += result["intent"] == row["intent"]
+
+    print(f"{'intent':<15} {'messages':>8} {'coverage':>9} {'accuracy':>9}")
+    for intent in INTENTS:
+        accuracy = correct[intent] / routed[intent] if routed[intent] else float("nan")
+        print(f"{intent:<15} {totals[intent]:>8} {routed[intent] / totals[intent]:>9.2f} {accuracy:>9.2f}")
+    allRouted = sum(routed.values())
+    print(
+        f"{'all':<15} {len(labelled):>8} {allRouted / len(labelled):>9.2f} "
+        f"{sum(correct.values()) / max(1, allRouted):>9.2f}"
+    )
+    print(f"latency p50={np.percentile(latencies, 50):.3f}ms p99={np.percentile(latencies, 99):.3f}ms")
@@ -0,0 +1,61 @@
+"""Latency and recall@k of the finance news HNSW index against brute force.
+
+Uses synthetic, clustered 384-d vectors (the all-MiniLM-L6-v2 size) so it runs
+without Mongo; the index is built with the same parameters as agent.newsindex.
+
+usage: python -m benchmarks.news_ann --sizes 10000 100000 1000000 --queries 200
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from agent.newsindex import hnswIndex, normalise
+
+
+def syntheticArticles(rows, dim, rng, clusters=256):
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    return normalise(centres[labels] + 0.6 * rng.normal(size=(rows, dim)).astype(np.float32))
+
+
+def perQuery(index, queries, k):
+    samples, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, positions = index.search(query.reshape(1, -1), k)
+        samples.append((time.perf_counter() - start) * 1000)
+        results.append(positions[0])
+    return np.array(samples), np.array(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--ef-search", type=int, default=64)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    queries = syntheticArticles(args.queries, args.dim, rng)
+    print(f"{'rows':>9} {'build s':>8} {'flat p50':>9} {'hnsw p50':>9} {'hnsw p99':>9} {'recall@' + str(args.k):>9}")
+    for rows in args.sizes:
+        vectors = syntheticArticles(rows, args.dim, rng)
+
+        flat = faiss.IndexFlatIP(args.dim)
+        flat.add(vectors)
+        hnsw = hnswIndex(args.dim, ef_search=args.ef_search)
+        start = time.perf_counter()
+        hnsw.add(vectors)
+        build = time.perf_counter() - start
+
+        flatTimes, truth = perQuery(flat, queries, args.k)
+        hnswTimes, found = perQuery(hnsw, queries, args.k)
+        recall = np.mean([len(set(t) & set(f)) / args.k for t, f in zip(truth, found)])
+        print(
+            f"{rows:>9} {build:>8.1f} {np.percentile(flatTimes, 50):>7.3f}ms "
+            f"{np.percentile(hnswTimes, 50):>7.3f}ms {np.percentile(hnswTimes, 99):>7.3f}ms {recall:>9.3f}"
+        )
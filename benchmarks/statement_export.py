@@ -0,0 +1,91 @@
+"""Rows/s and memory of rencie.exports.exportStatement on a synthetic account.
+
+The account's --rows transactions are generated as the cursor is read (nothing
+holds the history in memory) and the GridFS upload is replaced by a sink that
+only counts bytes, so the numbers are the cost of the export itself: building
+rows and writing CSV or PDF.
+
+Throughput is measured on --rows. Peak memory is measured under tracemalloc on
+1% and 10% of --rows; the two peaks should match, the export keeps no state per
+row (the PDF keeps two ints per page of 80 rows).
+
+usage: python -m benchmarks.statement_export [--rows 1000000] [--formats csv pdf]
+"""
+import argparse
+import time
+import tracemalloc
+import uuid
+
+ACCOUNT = "9876543210"
+
+
+class syntheticLedger:
+    "find() yields `rows` transactions of ACCOUNT, half sent and half received"
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def find(self, *args, **kwargs):
+        for n in range(self.rows):
+            counterparty = {"name": f"Customer {n % 5000}", "accountNumber": str(1000000000 + n % 5000)}
+            account = {"name": "Ray Eze", "accountNumber": ACCOUNT}
+            yield {
+                "transactionCreatedAt": f"2026-01-01T{n // 3600 % 24:02d}:{n // 60 % 60:02d}:{n % 60:02d}.{n % 1000000:06d}+00:00",
+                "transactionID": uuid.UUID(int=n).hex,
+                "senderInfo": account if n % 2 else counterparty,
+                "recipientInfo": counterparty if n % 2 else account,
+                "amount": 1000 + n % 997,
+                "status": "successful",
+            }
+
+
+class sinkUpload:
+    def __init__(self):
+        self._id = uuid.uuid4().hex
+        self.length = 0
+
+    def write(self, data):
+        self.length += len(data)
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class sinkBucket:
+    def open_upload_stream(self, filename, **kwargs):
+        return sinkUpload()
+
+
+def export(rows, fmt):
+    from rencie.exports import exportStatement
+
+    return exportStatement(syntheticLedger(rows), sinkBucket(), ACCOUNT, fmt, title="Synthetic statement")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--formats", nargs="+", default=["csv", "pdf"])
+    args = parser.parse_args()
+
+    print(f"{'format':<7} {'rows':>9} {'rows/s':>9} {'MiB out':>8}   peak KiB at 1% / 10% of rows")
+    for fmt in args.formats:
+        start = time.perf_counter()
+        result = export(args.rows, fmt)
+        elapsed = time.perf_counter() - start
+        assert result["rows"] == args.rows
+
+        peaks = []
+        for rows in (args.rows // 100, args.rows // 10):
+            tracemalloc.start()
+            export(rows, fmt)
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+            tracemalloc.stop()
+
+        print(
+            f"{fmt:<7} {args.rows:>9} {args.rows / elapsed:>9.0f} {result['bytes'] / 2**20:>8.1f}   "
+            f"{peaks[0]:.0f} / {peaks[1]:.0f}"
+        )
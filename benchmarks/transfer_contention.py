@@ -0,0 +1,122 @@
+"""Throughput and write-conflict rate of concurrent transfers between a few hot accounts.
+
+--workers threads run --transfers transfers through rencie.transfers.executeTransfer,
+each between two random accounts out of --accounts, so most transactions collide
+on the same documents. Every MongoDB call sleeps --mongo-ms, which keeps
+transactions open long enough to overlap.
+
+By default the accounts live in benchmarks/fakes.py's in-memory collections,
+whose transactions fail with WriteConflict like MongoDB's do. --mongodb runs
+against the replica set in MONGODB instead (transactions need one), in a
+scratch database that is dropped afterwards.
+
+Reports transfers/s, latency, retries per transfer (the conflict rate), transfers
+that gave up after TRANSFER_TIMEOUT (the give-up rate), and checks that no money was created
+or lost.
+
+usage: python -m benchmarks.transfer_contention [--transfers 2000] [--workers 32]
+                                                [--accounts 4] [--mongo-ms 1] [--mongodb]
+"""
+import argparse
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from prometheus_client import REGISTRY
+
+OPENING_BALANCE = 10**9
+
+
+def retries():
+    return sum(
+        REGISTRY.get_sample_value("bank_transaction_retries_total", {"reason": reason}) or 0
+        for reason in ("transient", "unknown_commit_result")
+    )
+
+
+def accountsFor(count):
+    return [
+        {
+            "accountNumber": str(9000000000 + n),
+            "firstName": f"Hot{n}",
+            "lastName": "Account",
+            "emailAddress": f"hot{n}@example.com",
+            "accountBalance": OPENING_BALANCE,
+        }
+        for n in range(count)
+    ]
+
+
+def balances(accounts):
+    return sum(doc["accountBalance"] for doc in accounts.find({}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transfers", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--accounts", type=int, default=4)
+    parser.add_argument("--mongo-ms", type=float, default=1)
+    parser.add_argument("--mongodb", action="store_true")
+    args = parser.parse_args()
+
+    from rencie.transfers import executeTransfer
+
+    seed = accountsFor(args.accounts)
+    if args.mongodb:
+        from rencie.db import getClient
+
+        client = getClient()
+        scratch = client[f"bench_transfers_{uuid.uuid4().hex[:8]}"]
+        accounts, ledger = scratch["accountInfo"], scratch["Transactions"]
+        accounts.insert_many([dict(doc) for doc in seed])
+        accounts.create_index("accountNumber", unique=True)
+        scratch.create_collection("Transactions")  # collections cannot be created inside a transaction
+    else:
+        from benchmarks.fakes import memoryClient, memoryCollection
+
+        client = memoryClient()
+        accounts = memoryCollection(seed, args.mongo_ms / 1000, "accountInfo")
+        ledger = memoryCollection((), args.mongo_ms / 1000, "Transactions")
+
+    numbers = [doc["accountNumber"] for doc in seed]
+    total = balances(accounts)
+
+    def transfer(_):
+        sender, recipient = random.sample(numbers, 2)
+        start = time.perf_counter()
+        try:
+            executeTransfer(client, accounts, ledger, sender, recipient, 1, "Hot", uuid.uuid4().hex)
+            ok = True
+        except Exception:
+            ok = False
+        return ok, (time.perf_counter() - start) * 1000
+
+    retriesBefore = retries()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(transfer, range(args.transfers)))
+    elapsed = time.perf_counter() - start
+    retried = retries() - retriesBefore
+
+    committed = sum(ok for ok, _ in results)
+    latencies = [ms for _, ms in results]
+    entries = len(list(ledger.find({})))
+    conserved = balances(accounts) == total
+    if args.mongodb:
+        client.drop_database(scratch.name)
+
+    backend = "mongodb" if args.mongodb else f"in-memory, {args.mongo_ms}ms per call"
+    print(f"{args.transfers} transfers, {args.workers} workers, {args.accounts} hot accounts ({backend})")
+    print(f"throughput: {committed / elapsed:.0f} committed transfers/s")
+    print(
+        f"latency: p50={np.percentile(latencies, 50):.1f}ms p95={np.percentile(latencies, 95):.1f}ms "
+        f"p99={np.percentile(latencies, 99):.1f}ms"
+    )
+    print(f"conflict rate: {retried / args.transfers:.2f} retries per transfer")
+    print(f"gave up: {args.transfers - committed} ({(args.transfers - committed) / args.transfers:.1%})")
+    print(f"ledger entries: {entries}, money conserved: {conserved}")
+    if entries != committed or not conserved:
+        raise SystemExit("the ledger or the balances do not match the committed transfers")
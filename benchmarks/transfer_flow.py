@@ -0,0 +1,71 @@
+"""Turn latency of the transfer flow, from the user's message to the OTP prompt.
+
+Runs the real graph offline: the message is routed by the local intent rules
+(no LLM call), the checkpointer is in memory, and the accounts and OTP
+collections and Resend are replaced by stand-ins that sleep for the given
+round-trip times.
+
+usage: python -m benchmarks.transfer_flow [--turns 50] [--mongo-ms 5] [--email-ms 300]
+"""
+import argparse
+import os
+import time
+import uuid
+
+import numpy as np
+
+os.environ.setdefault("FAST_INTENT", "1")
+os.environ.setdefault("FAST_INTENT_EMBEDDINGS", "0")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--mongo-ms", type=float, default=5)
+    parser.add_argument("--email-ms", type=float, default=300)
+    args = parser.parse_args()
+
+    from langchain_core.messages import HumanMessage
+    from langgraph.checkpoint.memory import MemorySaver
+    import agent.process as process
+    import rencie.logic as logic
+    from benchmarks.fakes import offline, scriptedChatModel
+
+    offline(
+        [{"accountNumber": "0123456789", "firstName": "Ada", "lastName": "Obi"}],
+        scriptedChatModel(),
+        mongo_latency=args.mongo_ms / 1000,
+    )
+
+    def sendEmail(subject="", body="", to=""):
+        time.sleep(args.email_ms / 1000)
+        return {"status": "successful", "response": f"email send to {to}"}
+
+    logic.bank.send_email = sendEmail
+
+    graph = process.agents.compileGraph(checkpointer=MemorySaver())
+    message = "send 5000 to 0123456789"
+    latencies = []
+    for turn in range(args.turns + 1):
+        config = {"configurable": {"thread_id": uuid.uuid4().hex}}
+        start = time.perf_counter()
+        result = graph.invoke(
+            {
+                "messages": [HumanMessage(content=message)],
+                "senderAccountNumber": "9876543210",
+                "name": "Ray",
+                "email": "ray@example.com",
+            },
+            config=config,
+        )
+        elapsed = (time.perf_counter() - start) * 1000
+        assert "__interrupt__" in result, "the flow did not reach the OTP prompt"
+        if turn:  # the first turn pays for imports and graph warm-up
+            latencies.append(elapsed)
+
+    print(f"turns={args.turns} mongo={args.mongo_ms}ms email={args.email_ms}ms")
+    print(
+        f"message -> OTP prompt: p50={np.percentile(latencies, 50):.1f}ms "
+        f"p95={np.percentile(latencies, 95):.1f}ms max={max(latencies):.1f}ms"
+    )
+    print("messages:", [m.content for m in result["messages"]])
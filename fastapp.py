@@ -1,20 +1,110 @@
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi import FastAPI, Request
 from pydantic import BaseModel
 import re
+import json
 from typing import Optional
 from fastapi import File, UploadFile
 from typing import Optional
 from pathlib import Path
 from fastapi.exceptions import HTTPException
-from agent.process import *
-from agent.ragsystem import *
 from rencie.logic import *
 from rencie.config import *
+from rencie.aio import runBlocking, useAsDefaultExecutor
+from rencie.db import acloseClients, getDatabase
 from prometheus_client import *
 
 
 app = FastAPI(title="Renci AI Agent Server", version="1.0.0")
+
+# ASYNC_GRAPH=0 runs the chat graph with the sync invoke() on the blocking pool instead
+ASYNC_GRAPH = os.getenv("ASYNC_GRAPH", "1") == "1"
+
+
+@app.on_event("startup")
+async def bindBlockingPool():
+    useAsDefaultExecutor()
+
+
+# MONGO_ENSURE_INDEXES=0 skips creating the bank indexes (when they are managed
+# elsewhere); missing ones then fail startup with MONGO_REQUIRE_INDEXES=1, and are
+# otherwise reported by the mongo_missing_indexes gauge
+@app.on_event("startup")
+async def checkBankIndexes():
+    from rencie.indexes import ensureIndexes, missingIndexes
+
+    required = os.getenv("MONGO_REQUIRE_INDEXES", "0") == "1"
+    bankDB = getDatabase("bank")
+    try:
+        if os.getenv("MONGO_ENSURE_INDEXES", "1") == "1":
+            await runBlocking(ensureIndexes, bankDB)
+        missing = await runBlocking(missingIndexes, bankDB)
+    except Exception as e:
+        if required:
+            raise
+        print(f"could not check the bank indexes: {e}")
+        return
+    if missing:
+        message = f"missing MongoDB indexes: {missing}"
+        if required:
+            raise RuntimeError(message)
+        print(message)
+
+
+# chat checkpoints are pruned by one process, the Celery beat task
+# bank.pruneCheckpoints or `python -m agent.retention`, not by every API worker.
+# CHECKPOINT_RETENTION=1 runs it here instead, for a single-worker deployment
+@app.on_event("startup")
+async def startCheckpointRetention():
+    if os.getenv("CHECKPOINT_RETENTION", "0") != "1":
+        return
+    from agent.retention import fromEnv
+
+    app.state.retention = fromEnv().start()
+
+
+@app.on_event("shutdown")
+async def stopCheckpointRetention():
+    retention = getattr(app.state, "retention", None)
+    if retention is not None:
+        await runBlocking(retention.stop)
+
+
+# NEWS_INDEX_SYNC=0 leaves the news index to be loaded by the first news query instead
+@app.on_event("startup")
+async def startNewsIndex():
+    if os.getenv("NEWS_INDEX_SYNC", "1") != "1":
+        return
+    from agent.newsindex import getNewsIndex
+
+    app.state.newsIndex = getNewsIndex().start()
+
+
+@app.on_event("shutdown")
+async def stopNewsIndex():
+    news = getattr(app.state, "newsIndex", None)
+    if news is not None:
+        await runBlocking(news.stop)
+
+
+@app.on_event("shutdown")
+async def closeMongo():
+    await acloseClients()
+
+
+# LangGraph, LangChain and torch are imported by the first request that needs them,
+# so starting the server (and the banking endpoints) does not pay for the AI stack
+def chatGraph():
+    from agent.process import getGraph
+
+    return getGraph()
+
+
+def ingestionJobs():
+    from agent.ingest import ingestion
+
+    return ingestion
+
 HTTP_REQUEST_LATENCY = Histogram(
     "http_request_duration_seconds",
     "HTTP request latency",
@@ -74,9 +164,11 @@ async def create_vector_store(file_path: UploadFile = File(...)):
         with open(filename, "wb") as buffer:
             content = await file_path.read()
             buffer.write(content)
-        vectorstorecreator(filename)
+        job = ingestionJobs().submitDocument(filename, safe_filename)
 
-        return {"message": "Vector store created successfully."}
+        return JSONResponse(
+            content={"status": "Processing", "response": job}, status_code=202
+        )
 
     except Exception as e:
         if os.path.exists(filename):
@@ -85,60 +177,108 @@ async def create_vector_store(file_path: UploadFile = File(...)):
             status_code=500, detail=f"Error creating vector store: {str(e)}"
         )
 
+@app.get("/create-vector-store/{job_id}")
+async def vector_store_job(job_id: str):
+    job = ingestionJobs().status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return JSONResponse(content={"status": job["status"], "response": job}, status_code=200)
+
+@app.delete("/vector-store/{document_id}")
+async def remove_vector_store_document(document_id: str):
+    job = ingestionJobs().submitRemoval(document_id)
+    return JSONResponse(content={"status": "Processing", "response": job}, status_code=202)
+
+def chatConfig(decodedJWT: dict) -> dict:
+    return {"configurable": {"thread_id": decodedJWT["accountNumber"]}}
+
+
+def chatTurn(compiled, query: str, decodedJWT: dict, current_state=None):
+    """works out what this turn feeds the graph: a resume value when it is waiting
+    on the OTP interrupt, otherwise a new message. returns (config, graph_input, early_response)
+
+    pass current_state when it was already read with aget_state, otherwise it is read here"""
+    from langchain_core.messages import HumanMessage
+    from langgraph.types import Command
+
+    accntNumber = decodedJWT["accountNumber"]
+    config = chatConfig(decodedJWT)
+    if current_state is None:
+        current_state = compiled.get_state(config)
+
+    if current_state.next:
+        otp_value = extract_stop_word(query)
+
+        if otp_value:
+            compiled.clear_interrupts(config)
+
+            return config, None, JSONResponse(
+                content={
+                    "status": "success",
+                    "response": "Your transaction has been stopped, but previous messages are retained."
+                },
+                status_code=200
+            )
+
+        if otp_value is None:
+            return config, None, JSONResponse(
+                content={"status": "error", "message": "OTP is required when graph is interrupted"},
+                status_code=400
+            )
+
+        return config, Command(resume=extract_five_digit_number(query)), None
+
+    if not query:
+        return config, None, JSONResponse(
+            content={"status": "error", "message": "Query is required"},
+            status_code=400
+        )
+
+    return config, {
+        "messages": [HumanMessage(content=query)],
+        "senderAccountNumber": accntNumber,
+        "name": decodedJWT["name"],
+        "email": decodedJWT["email"],
+    }, None
+
+
+async def achatTurn(compiled, query: str, decodedJWT: dict):
+    """chatTurn for the event loop: the state is read with aget_state, and a turn
+    waiting on the OTP interrupt, which may clear it with the sync
+    clear_interrupts, runs on the blocking pool"""
+    current_state = await compiled.aget_state(chatConfig(decodedJWT))
+    if current_state.next:
+        return await runBlocking(chatTurn, compiled, query, decodedJWT, current_state)
+    return chatTurn(compiled, query, decodedJWT, current_state)
+
+
+def chatErrorStatus(e: Exception) -> int:
+    "503 when the LLM gateway shed the turn (overloaded or provider down), so clients retry"
+    from agent.gateway import LLMUnavailable
+
+    return 503 if isinstance(e, LLMUnavailable) else 500
+
+
 @app.post("/api/chat")
 async def chat_endpoint(req: Payload, request: Request):
     try:
+        compiled = chatGraph()
         auth_header = request.headers.get("JWT")
         decodedJWT = bank.decodeJWT(auth_header)
-        accntNumber = decodedJWT["accountNumber"]
         data = req.dict()
         query = data.get("query")
 
-        config = {"configurable": {"thread_id": accntNumber}}
-        current_state = compiled.get_state(config)
-
-        if current_state.next:
-            otp_value = extract_stop_word(query)
-
-            if otp_value and otp_value.lower() == "stop":
-                compiled.clear_interrupts(config)
-                
-                return JSONResponse(
-                    content={
-                        "status": "success",
-                        "response": "Your transaction has been stopped, but previous messages are retained."
-                    },
-                    status_code=200
-                )
-
-            if otp_value is None:
-                return JSONResponse(
-                    content={"status": "error", "message": "OTP is required when graph is interrupted"},
-                    status_code=400
-                )
-
-            response = compiled.invoke(
-                Command(resume=extract_five_digit_number(query)),
-                config=config
-            )
+        if ASYNC_GRAPH:
+            config, graph_input, early_response = await achatTurn(compiled, query, decodedJWT)
+        else:
+            config, graph_input, early_response = await runBlocking(chatTurn, compiled, query, decodedJWT)
+        if early_response is not None:
+            return early_response
 
+        if ASYNC_GRAPH:
+            response = await compiled.ainvoke(graph_input, config=config)
         else:
-            query = data.get("query")
-            if not query:
-                return JSONResponse(
-                    content={"status": "error", "message": "Query is required"},
-                    status_code=400
-                )
-
-            response = compiled.invoke(
-                {
-                    "messages": [HumanMessage(content=query)],
-                    "senderAccountNumber": accntNumber,
-                    "name": decodedJWT["name"],
-                    "email": decodedJWT["email"],
-                },
-                config=config,
-            )
+            response = await runBlocking(compiled.invoke, graph_input, config=config)
 
         lastMessage = None
         if response and response.get("messages"):
@@ -155,6 +295,82 @@ async def chat_endpoint(req: Payload, request: Request):
             status_code=200
         )
 
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JSONResponse(
+            content={"status": "error", "message": str(e)},
+            status_code=chatErrorStatus(e)
+        )
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def streamChatTurn(compiled, graph_input, config):
+    """runs the graph with stream() and turns its output into server-sent events:
+    node (a node finished), token (chat LLM output as it is generated), message (a
+    complete message from any other node), interrupt (the OTP prompt) and a final
+    end event carrying the same status/response /api/chat would have returned"""
+    from langchain_core.messages import AIMessage, AIMessageChunk
+
+    interrupted = None
+    try:
+        for mode, chunk in compiled.stream(
+            graph_input, config=config, stream_mode=["updates", "messages"]
+        ):
+            if mode == "messages":
+                message, metadata = chunk
+                node = metadata.get("langgraph_node")
+                if not message.content or not isinstance(message.content, str):
+                    continue
+                if isinstance(message, AIMessageChunk):
+                    # the intent node's LLM output is a tool call for the router, not for the user
+                    if node == "chat":
+                        yield sse("token", {"content": message.content})
+                elif isinstance(message, AIMessage) and node != "intent":
+                    yield sse("message", {"node": node, "content": message.content})
+                continue
+
+            for node, update in chunk.items():
+                if node == "__interrupt__":
+                    interrupted = update[0].value
+                    yield sse("interrupt", {"prompt": interrupted})
+                else:
+                    yield sse("node", {"node": node})
+
+        if interrupted is not None:
+            yield sse("end", {"status": "interrupted", "response": interrupted})
+            return
+        messages = compiled.get_state(config).values.get("messages") or []
+        if not messages:
+            yield sse("end", {"status": "error", "response": "No messages returned from the graph."})
+            return
+        yield sse("end", {"status": "success", "response": messages[-1].content})
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        yield sse("error", {"status": "error", "message": str(e)})
+
+
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(req: Payload, request: Request):
+    try:
+        compiled = chatGraph()
+        decodedJWT = bank.decodeJWT(request.headers.get("JWT"))
+        config, graph_input, early_response = await achatTurn(compiled, req.dict().get("query"), decodedJWT)
+        if early_response is not None:
+            return early_response
+
+        # a sync generator, starlette iterates it in its threadpool so the event loop stays free
+        return StreamingResponse(
+            streamChatTurn(compiled, graph_input, config),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -176,7 +392,8 @@ async def createAccount(req: createPayload):
         phoneNumber: int = requestPayload.get("phoneNumber")
         emailAddress: str = requestPayload.get("emailAddress")
         ethAddress : str = requestPayload.get("ethAddress")
-        task = bank.createUser.delay(
+        task = await runBlocking(
+            bank.createUser.delay,
             firstName, lastName, dob, password, phoneNumber, emailAddress, ethAddress
         )
 
@@ -200,7 +417,7 @@ async def login(req: loginPayload):
         accountNumber: str = requestPayload.get("accountNumber")
         password: str = requestPayload.get("password")
 
-        response = bank.authenticateUser(accountNumber, password)
+        response = await bank.aauthenticateUser(accountNumber, password)
         return JSONResponse(
             content={"status": "successful", "token": f"{response['token']}"},
             status_code=201,
@@ -216,7 +433,7 @@ async def checkBalance(req: checkBalancePayload):
     try:
         requestPayload = req.dict()
         token = bank.decodeJWT(requestPayload.get("token"))
-        response = bank.checkBalance(token["accountNumber"])
+        response = await bank.acheckBalance(token["accountNumber"])
         return JSONResponse(
             content={"status": "successful", "response": response}, status_code=201
         )
@@ -227,11 +444,17 @@ async def checkBalance(req: checkBalancePayload):
 
 
 @app.post("/api/v1/check-statement")
-async def getTransactionStatement(req: checkBalancePayload):
+async def getTransactionStatement(req: statementPayload):
     try:
         requestPayload = req.dict()
         token = bank.decodeJWT(requestPayload.get("token"))
-        response = bank.getBankStatement.delay(token["accountNumber"], token["name"], token["email"])
+        start, end = (
+            requestPayload[bound].isoformat() if requestPayload.get(bound) else None
+            for bound in ("startDate", "endDate")
+        )
+        response = await runBlocking(
+            bank.getBankStatement.delay, token["accountNumber"], token["name"], token["email"], start, end
+        )
         return JSONResponse(
             content={
                 "status": "Processing",
@@ -244,6 +467,68 @@ async def getTransactionStatement(req: checkBalancePayload):
         )
 
 
+@app.post("/api/v1/statement-export")
+async def exportTransactionStatement(req: statementExportPayload):
+    try:
+        requestPayload = req.dict()
+        token = bank.decodeJWT(requestPayload.get("token"))
+        start, end = (
+            requestPayload[bound].isoformat() if requestPayload.get(bound) else None
+            for bound in ("startDate", "endDate")
+        )
+        await runBlocking(
+            bank.exportStatement.delay,
+            token["accountNumber"],
+            token["name"],
+            token["email"],
+            requestPayload["format"],
+            start,
+            end,
+        )
+        return JSONResponse(
+            content={
+                "status": "Processing",
+                "response": "Your statement is being prepared, it will be sent to your email"},
+            status_code=201,
+        )
+    except Exception as e:
+        return JSONResponse(
+            content={"status": "failed", "response": str(e)}, status_code=500
+        )
+
+
+@app.get("/api/v1/statement-export/{download_token}")
+async def downloadTransactionStatement(download_token: str):
+    import jwt
+    from bson import ObjectId
+    from bson.errors import InvalidId
+    from gridfs.errors import NoFile
+
+    try:
+        fileID, accountNumber = exports.readDownloadToken(download_token, JWT_SECRET)
+        bucket = exports.getExportBucket()
+        download = await runBlocking(bucket.open_download_stream, ObjectId(fileID))
+    except jwt.ExpiredSignatureError:
+        return JSONResponse(
+            content={"status": "failed", "response": "this download link has expired"}, status_code=410
+        )
+    except (jwt.InvalidTokenError, InvalidId, NoFile):
+        return JSONResponse(
+            content={"status": "failed", "response": "statement not found"}, status_code=404
+        )
+    metadata = download.metadata or {}
+    if metadata.get("accountNumber") != accountNumber:
+        return JSONResponse(
+            content={"status": "failed", "response": "statement not found"}, status_code=404
+        )
+    # a sync iterator, Starlette reads it on its threadpool one GridFS chunk at a time
+    return StreamingResponse(
+        iter(download.readchunk, b""),
+        media_type=metadata.get("contentType", "application/octet-stream"),
+        headers={"Content-Disposition": f'attachment; filename="{download.filename}"'},
+    )
+
+
 @app.post("/api/v1/transfer")
 async def transfer(req: transferPayload):
     try:
@@ -251,7 +536,26 @@ async def transfer(req: transferPayload):
         token = bank.decodeJWT(requestPayload.get("token"))
         receipientAccntNumber = requestPayload.get("receipientAccntNumber")
         amount = requestPayload.get("amount")
-        response = bank.transferMoney(token["accountNumber"], receipientAccntNumber, amount, token["name"])
+        response = await runBlocking(
+            bank.transferMoney, token["accountNumber"], receipientAccntNumber, amount, token["name"]
+        )
+        return JSONResponse(
+            content={"status": "successful", "response": response}, status_code=201
+        )
+    except Exception as e:
+        return JSONResponse(
+            content={"status": "failed", "response": str(e)}, status_code=500
+        )
+
+
+@app.post("/api/v1/bulk-transfer")
+async def bulkTransfer(req: bulkTransferPayload):
+    try:
+        requestPayload = req.dict()
+        token = bank.decodeJWT(requestPayload.get("token"))
+        response = await runBlocking(
+            bank.bulkTransfer, token["accountNumber"], token["name"], requestPayload.get("transfers")
+        )
         return JSONResponse(
             content={"status": "successful", "response": response}, status_code=201
         )
@@ -0,0 +1,21 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# every blocking call made on behalf of an async request (pymongo, bcrypt, Resend,
+# sync graph nodes, the checkpointer) shares this pool, so a burst of slow calls
+# queues here instead of spawning threads without limit
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "32"))
+blockingPool = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+
+async def runBlocking(fn, *args, **kwargs):
+    "runs fn(*args, **kwargs) on the bounded pool without blocking the event loop"
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blockingPool, functools.partial(fn, *args, **kwargs))
+
+
+def useAsDefaultExecutor():
+    "makes run_in_executor(None, ...) calls (LangGraph, LangChain) use the bounded pool too"
+    asyncio.get_running_loop().set_default_executor(blockingPool)
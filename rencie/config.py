@@ -1,5 +1,7 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+from datetime import datetime
+import os
 from celery import Celery
 
 
@@ -12,6 +14,13 @@ celery_app.conf.update(
         "logic.*": {"queue": "default"},
     }
 )
+# run with the worker's -B: one scheduler, so one process prunes the chat checkpoints
+celery_app.conf.beat_schedule = {
+    "prune-checkpoints": {
+        "task": "rencie.logic.pruneCheckpoints",
+        "schedule": float(os.getenv("CHECKPOINT_RETENTION_INTERVAL", "3600")),
+    },
+}
 # celery_app.autodiscover_tasks(["renci"])
 
 class responsemodel(BaseModel):
@@ -48,5 +57,26 @@ class transferPayload(BaseModel):
     amount: int
 
 
+class bulkTransferItem(BaseModel):
+    receipientAccntNumber: str
+    amount: int
+
+
+class bulkTransferPayload(BaseModel):
+    token: str
+    transfers: List[bulkTransferItem] = Field(min_length=1, max_length=1000)
+
+
 class checkBalancePayload(BaseModel):
     token: str
+
+
+class statementPayload(BaseModel):
+    token: str
+    # optional range of the statement, startDate inclusive and endDate exclusive
+    startDate: Optional[datetime] = None
+    endDate: Optional[datetime] = None
+
+
+class statementExportPayload(statementPayload):
+    format: Literal["csv", "pdf"] = "csv"
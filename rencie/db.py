@@ -0,0 +1,205 @@
+"""The MongoDB client of this process, shared by every module.
+
+MongoClient owns a connection pool and monitor threads per server, so the
+banking logic, the checkpointer, the news index and the monitoring job all go
+through getClient() instead of opening their own. The client is created on
+first use and again in a forked child (Celery prefork workers): a pool
+inherited across fork() is never reused.
+
+Module-level collections are lazyCollection proxies, so importing a module
+does not connect, and a proxy created before a fork resolves to the child's
+client.
+
+Each database is opened for a workload, whose read preference comes from
+MONGO_READ_PREFERENCE_<WORKLOAD>. Balances, OTPs and checkpoints must read
+their own writes, so only the news and analytics workloads default to
+secondaries.
+"""
+import os
+import threading
+from pymongo import MongoClient, ReadPreference
+from rencie.monitoring import MONGO_POOL_MAX, mongoListeners
+
+# MONGODB is the name used by the deployment's env file, MONGO the older one
+MONGO_URI = os.getenv("MONGODB") or os.getenv("MONGO")
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+WORKLOADS = {
+    "bank": "primary",
+    "checkpoints": "primary",
+    "news": "secondaryPreferred",
+    "analytics": "secondaryPreferred",
+}
+
+
+def clientOptions():
+    "pool and timeout options shared by the sync and asyncio clients"
+    options = {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "50")),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_MS", "60000")),
+        "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+        "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000")),
+        "appname": os.getenv("MONGO_APP_NAME", "rencie"),
+    }
+    # unset leaves socket reads unbounded, as the driver does by default
+    if os.getenv("MONGO_SOCKET_TIMEOUT_MS"):
+        options["socketTimeoutMS"] = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS"))
+    return options
+
+
+def readPreference(workload):
+    name = os.getenv(f"MONGO_READ_PREFERENCE_{workload.upper()}", WORKLOADS.get(workload, "primary"))
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"unknown read preference {name!r} for the {workload} workload")
+    return READ_PREFERENCES[name]
+
+
+_lock = threading.Lock()
+_state = {"pid": None, "client": None, "async": None, "databases": {}}
+
+
+def _forget():
+    # after fork the child holds the parent's sockets and a lock another thread may
+    # have held; drop the references without closing anything the parent still uses
+    global _lock
+    _lock = threading.Lock()
+    _state.update(pid=None, client=None, databases={})
+    _state["async"] = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget)
+
+
+def _claim():
+    "under _lock: drops both clients when this process did not create them (a fork without register_at_fork)"
+    if _state["pid"] != os.getpid():
+        _state.update(pid=os.getpid(), client=None, databases={})
+        _state["async"] = None
+
+
+def getClient() -> MongoClient:
+    "this process's MongoClient, created on first use"
+    client = _state["client"]
+    if client is not None and _state["pid"] == os.getpid():
+        return client
+    with _lock:
+        _claim()
+        if _state["client"] is None:
+            options = clientOptions()
+            MONGO_POOL_MAX.set(options["maxPoolSize"])
+            _state.update(
+                client=MongoClient(MONGO_URI, event_listeners=mongoListeners(), **options),
+                databases={},
+            )
+        return _state["client"]
+
+
+def getDatabase(name, workload="bank"):
+    "the database on the shared client, with the workload's read preference"
+    client = getClient()
+    key = (name, workload)
+    database = _state["databases"].get(key)
+    if database is None:
+        database = client.get_database(name, read_preference=readPreference(workload))
+        _state["databases"][key] = database
+    return database
+
+
+def getAsyncClient():
+    """this process's AsyncMongoClient for the async endpoints, with the same pool
+    options. It is created on first use because it binds to the running event loop"""
+    client = _state["async"]
+    if client is not None and _state["pid"] == os.getpid():
+        return client
+    from pymongo import AsyncMongoClient
+
+    with _lock:
+        _claim()
+        if _state["async"] is None:
+            _state["async"] = AsyncMongoClient(
+                MONGO_URI, event_listeners=mongoListeners(), **clientOptions()
+            )
+        return _state["async"]
+
+
+def getAsyncDatabase(name, workload="bank"):
+    return getAsyncClient().get_database(name, read_preference=readPreference(workload))
+
+
+def _detach():
+    "takes this process's clients out of _state, (sync, async), None for those it does not own"
+    with _lock:
+        if _state["pid"] != os.getpid():
+            return None, None
+        client, asyncClient = _state["client"], _state["async"]
+        _state.update(client=None, databases={})
+        _state["async"] = None
+    return client, asyncClient
+
+
+def closeClients():
+    """closes the sync client, and the async one when no event loop is running; for
+    process shutdown. An API process closes both with acloseClients instead"""
+    client, asyncClient = _detach()
+    if client is not None:
+        client.close()
+    if asyncClient is not None:
+        import asyncio
+
+        # the async client belongs to a loop, with none left its close() can run on a new one
+        try:
+            asyncio.run(asyncClient.close())
+        except RuntimeError as e:
+            print(f"could not close the async MongoDB client, use acloseClients: {e}")
+
+
+async def acloseClients():
+    "closes both clients from the event loop the async client was used on; for process shutdown"
+    from rencie.aio import runBlocking
+
+    client, asyncClient = _detach()
+    if asyncClient is not None:
+        await asyncClient.close()
+    if client is not None:
+        await runBlocking(client.close)
+
+
+class lazyClient:
+    "the shared client, resolved when first used"
+
+    def __getattr__(self, name):
+        return getattr(getClient(), name)
+
+    def __getitem__(self, name):
+        return getDatabase(name)
+
+
+class lazyCollection:
+    "a collection on the shared client, resolved on each use"
+
+    def __init__(self, database, name, workload="bank"):
+        self.database = database
+        self.name = name
+        self.workload = workload
+
+    def get(self):
+        return getDatabase(self.database, self.workload)[self.name]
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+    def __repr__(self):
+        return f"lazyCollection({self.database}.{self.name}, {self.workload})"
+
+
+client = lazyClient()
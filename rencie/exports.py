@@ -0,0 +1,276 @@
+"""Itemised statement exports, CSV or PDF, in constant memory.
+
+exportStatement() reads the account's transactions oldest first through a
+cursor fetching EXPORT_BATCH_SIZE documents per round trip, turns each into a
+row and hands it to a writer that writes straight into a GridFS upload stream,
+which stores the file in 255KB chunks as it grows. At any time the worker holds
+one cursor batch, one writer buffer and one GridFS chunk, whatever the length
+of the history.
+
+The PDF writer is written by hand for the same reason: it emits each page as
+soon as it is full, and only keeps the byte offset of every object (two
+8-byte ints per page, in an array) for the cross-reference table and page tree
+written at the end.
+
+Files live in the statementExports bucket of the bank database. Exports up to
+EXPORT_ATTACH_MAX_BYTES are attached to the email, larger ones are linked with a
+signed token (downloadToken). Exports older than EXPORT_TTL_HOURS are deleted
+when the next one is made.
+"""
+import csv
+import io
+import os
+import unicodedata
+from array import array
+from datetime import datetime, timedelta, timezone
+
+import jwt
+from rencie.statements import createdBetween
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_TTL_HOURS = float(os.getenv("EXPORT_TTL_HOURS", "24"))
+EXPORT_ATTACH_MAX_BYTES = int(os.getenv("EXPORT_ATTACH_MAX_BYTES", str(2 * 1024 * 1024)))
+EXPORT_BUCKET = "statementExports"
+
+COLUMNS = ["date", "transactionID", "type", "counterparty", "counterpartyAccount", "amount", "status"]
+PROJECTION = {
+    "_id": 0,
+    "transactionCreatedAt": 1,
+    "transactionID": 1,
+    "senderInfo": 1,
+    "recipientInfo": 1,
+    "amount": 1,
+    "status": 1,
+}
+
+
+def getExportBucket():
+    from gridfs import GridFSBucket
+    from rencie.db import getDatabase
+
+    return GridFSBucket(getDatabase("bank"), bucket_name=EXPORT_BUCKET)
+
+
+def statementCursor(collection, accountNumber, start=None, end=None, batch_size=None):
+    "the account's transactions in [start, end), oldest first, fetched batch_size at a time"
+    created = createdBetween(start, end)
+    return collection.find(
+        {
+            "$or": [
+                {"senderInfo.accountNumber": accountNumber, **created},
+                {"recipientInfo.accountNumber": accountNumber, **created},
+            ]
+        },
+        PROJECTION,
+        sort=[("transactionCreatedAt", 1)],
+        batch_size=batch_size or EXPORT_BATCH_SIZE,
+    )
+
+
+def statementRow(doc, accountNumber):
+    sent = (doc.get("senderInfo") or {}).get("accountNumber") == accountNumber
+    counterparty = (doc.get("recipientInfo") if sent else doc.get("senderInfo")) or {}
+    return [
+        doc.get("transactionCreatedAt", ""),
+        doc.get("transactionID", ""),
+        "debit" if sent else "credit",
+        counterparty.get("name", ""),
+        counterparty.get("accountNumber", ""),
+        doc.get("amount", 0),
+        doc.get("status", ""),
+    ]
+
+
+class csvStatement:
+    "CSV rows written to a binary stream, flushed every `flush_bytes`"
+
+    media_type = "text/csv"
+
+    def __init__(self, stream, title="", flush_bytes=64 * 1024):
+        self.stream = stream
+        self.flush_bytes = flush_bytes
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.writer.writerow(COLUMNS)
+
+    def _flush(self):
+        self.stream.write(self.buffer.getvalue().encode("utf-8"))
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+        if self.buffer.tell() >= self.flush_bytes:
+            self._flush()
+
+    def close(self):
+        self._flush()
+
+
+def latin1(char):
+    "char if the PDF font can show it, else its base letter (Yoruba Ọ, ẹ, ṣ → O, e, s), else ?"
+    if ord(char) < 256:
+        return char
+    base = unicodedata.normalize("NFKD", char).encode("latin-1", "ignore").decode("latin-1")
+    return base or ("" if unicodedata.combining(char) else "?")
+
+
+def showable(value):
+    "value as text the PDF font can show, one character per glyph"
+    text = str(value)
+    if text.isascii():
+        return text
+    text = unicodedata.normalize("NFC", text)
+    try:
+        text.encode("latin-1")
+        return text
+    except UnicodeEncodeError:
+        return "".join(map(latin1, text))
+
+
+def pdfText(value):
+    "value as a PDF string literal body; the font uses WinAnsiEncoding, which matches latin-1 for letters"
+    text = showable(value)
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+class pdfStatement:
+    """a PDF of fixed-width rows, A4 pages of `rows_per_page`, written page by page.
+
+    Object 1 is the catalog and 2 the page tree, both written last; 3 is the font,
+    then every page is a content stream and a page object, 4 and 5 for the first.
+    """
+
+    media_type = "application/pdf"
+    WIDTHS = [20, 33, 7, 24, 11, 14, 11]
+
+    def __init__(self, stream, title="", rows_per_page=80):
+        self.stream = stream
+        self.title = title
+        self.rows_per_page = rows_per_page
+        self.position = 0
+        # offsets[n] is where object n starts, 0 is the free-list head
+        self.offsets = array("Q", [0, 0, 0, 0])
+        self.rows = []
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>")
+
+    def _write(self, data):
+        self.stream.write(data)
+        self.position += len(data)
+
+    def _object(self, number, body):
+        if number < len(self.offsets):
+            self.offsets[number] = self.position
+        else:
+            self.offsets.append(self.position)
+        self._write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+    @property
+    def pageCount(self):
+        return (len(self.offsets) - 4) // 2
+
+    def _line(self, row):
+        # the ISO timestamp to the second, so the columns fit the page
+        row = [str(row[0])[:19].replace("T", " ")] + list(row[1:])
+        return "".join(showable(cell)[: width - 1].ljust(width) for cell, width in zip(row, self.WIDTHS))
+
+    def _page(self):
+        lines = [self.title, "", self._line(COLUMNS)] + [self._line(row) for row in self.rows]
+        text = "".join(f"({pdfText(line)}) Tj T* " for line in lines)
+        content = f"BT /F1 7 Tf 9 TL 30 810 Td {text}ET".encode("latin-1")
+        contentNumber = len(self.offsets)
+        pageNumber = contentNumber + 1
+        self._object(contentNumber, b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        self._object(
+            pageNumber,
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % contentNumber,
+        )
+        self.rows = []
+
+    def writerow(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.rows_per_page:
+            self._page()
+
+    def close(self):
+        if self.rows or not self.pageCount:
+            self._page()
+        # the page tree and the xref table are written a page at a time too
+        self.offsets[2] = self.position
+        self._write(b"2 0 obj\n<< /Type /Pages /Kids [")
+        for page in range(5, len(self.offsets), 2):
+            self._write(b"%d 0 R " % page)
+        self._write(b"] /Count %d >>\nendobj\n" % self.pageCount)
+        self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref = self.position
+        count = len(self.offsets)
+        self._write(b"xref\n0 %d\n0000000000 65535 f \n" % count)
+        for number in range(1, count):
+            self._write(b"%010d 00000 n \n" % self.offsets[number])
+        self._write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, xref))
+
+
+WRITERS = {"csv": csvStatement, "pdf": pdfStatement}
+
+
+def exportStatement(collection, bucket, accountNumber, fmt="csv", start=None, end=None, title=""):
+    """streams the account's transactions in [start, end) into a new file in bucket.
+    returns {fileID, filename, rows, bytes}"""
+    writerClass = WRITERS[fmt]
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    filename = f"statement-{accountNumber}-{stamp}.{fmt}"
+    upload = bucket.open_upload_stream(
+        filename,
+        metadata={"accountNumber": accountNumber, "format": fmt, "contentType": writerClass.media_type},
+    )
+    rows = 0
+    try:
+        writer = writerClass(upload, title)
+        for doc in statementCursor(collection, accountNumber, start, end):
+            writer.writerow(statementRow(doc, accountNumber))
+            rows += 1
+        writer.close()
+        upload.close()
+    except BaseException:
+        # drops the chunks already uploaded
+        upload.abort()
+        raise
+    return {"fileID": upload._id, "filename": filename, "rows": rows, "bytes": upload.length}
+
+
+def purgeExpiredExports(bucket, ttl_hours=None):
+    "deletes exports made more than ttl_hours ago, returns how many"
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=ttl_hours or EXPORT_TTL_HOURS)
+    expired = [grid._id for grid in bucket.find({"uploadDate": {"$lt": cutoff}})]
+    for fileID in expired:
+        bucket.delete(fileID)
+    return len(expired)
+
+
+DOWNLOAD_AUDIENCE = "statement-download"
+
+
+def downloadToken(fileID, accountNumber, secret, ttl_hours=None):
+    """a signed token naming the export and its owner, valid as long as the file is kept.
+    its audience keeps it from being accepted as a session token (see bank.decodeJWT)"""
+    expires = datetime.now(timezone.utc) + timedelta(hours=ttl_hours or EXPORT_TTL_HOURS)
+    return jwt.encode(
+        {
+            "fileID": str(fileID),
+            "accountNumber": accountNumber,
+            "aud": DOWNLOAD_AUDIENCE,
+            "exp": int(expires.timestamp()),
+        },
+        secret,
+        algorithm="HS256",
+    )
+
+
+def readDownloadToken(token, secret):
+    "the (fileID, accountNumber) a downloadToken names; raises jwt's errors when invalid or expired"
+    claims = jwt.decode(
+        token, secret, algorithms=["HS256"], audience=DOWNLOAD_AUDIENCE, options={"require": ["aud", "exp"]}
+    )
+    return claims["fileID"], claims["accountNumber"]
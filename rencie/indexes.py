@@ -0,0 +1,104 @@
+"""Indexes the bank collections need, applied idempotently at startup.
+
+Every hot path filters on one of these: account lookups by accountNumber
+(login, balance, transfers, account creation), OTP checks by otpID, and the
+statement's history queries by the sender or recipient account, newest first.
+OTP.expiresAt is a Date with a TTL index, so MongoDB deletes expired OTPs
+itself (its TTL monitor runs about once a minute, validateOTP still checks the
+expiry).
+
+ensureIndexes() creates whatever is missing; createIndexes is a no-op for an
+index that already exists with the same spec. missingIndexes() reports what is
+still absent, which fastapp turns into a failed startup (MONGO_REQUIRE_INDEXES=1)
+or the mongo_missing_indexes gauge for an alert.
+
+usage: python -m rencie.indexes [--check]
+"""
+import sys
+from datetime import datetime, timezone
+from prometheus_client import Gauge
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+MISSING_INDEXES = Gauge(
+    "mongo_missing_indexes", "Expected indexes absent from the bank collections", ["collection"]
+)
+
+BANK_INDEXES = {
+    "accountInfo": [
+        IndexModel([("accountNumber", ASCENDING)], unique=True, name="accountNumber_unique"),
+    ],
+    "Transactions": [
+        IndexModel(
+            [("senderInfo.accountNumber", ASCENDING), ("transactionCreatedAt", DESCENDING)],
+            name="sender_history",
+        ),
+        IndexModel(
+            [("recipientInfo.accountNumber", ASCENDING), ("transactionCreatedAt", DESCENDING)],
+            name="recipient_history",
+        ),
+    ],
+    "OTP": [
+        IndexModel([("otpID", ASCENDING)], name="otpID"),
+        IndexModel([("expiresAt", ASCENDING)], expireAfterSeconds=0, name="expiresAt_ttl"),
+    ],
+}
+
+
+def purgeLegacyOTPs(db):
+    """deletes expired OTPs whose expiresAt is still an ISO string, which the TTL
+    index ignores. Those strings share one format, so they compare as dates"""
+    now = datetime.now(timezone.utc).isoformat()
+    return db["OTP"].delete_many({"expiresAt": {"$type": "string", "$lt": now}}).deleted_count
+
+
+def ensureIndexes(db):
+    "creates the missing indexes, returns {collection: [names]} that could not be built"
+    failed = {}
+    for name, indexes in BANK_INDEXES.items():
+        try:
+            db[name].create_indexes(indexes)
+        except OperationFailure as e:
+            # usually an index of the same name with other options, or duplicate
+            # account numbers blocking the unique index; left for an operator
+            print(f"could not create the {name} indexes: {e}")
+            failed[name] = [index.document["name"] for index in indexes]
+    purgeLegacyOTPs(db)
+    return failed
+
+
+def sameIndex(expected, existing):
+    spec = expected.document
+    return (
+        list(spec["key"].items()) == list(existing["key"])
+        and spec.get("unique", False) == existing.get("unique", False)
+        and spec.get("expireAfterSeconds") == existing.get("expireAfterSeconds")
+    )
+
+
+def missingIndexes(db):
+    "{collection: [index names]} of the expected indexes that are absent or differ"
+    missing = {}
+    for name, indexes in BANK_INDEXES.items():
+        existing = db[name].index_information()
+        absent = [
+            index.document["name"]
+            for index in indexes
+            if not any(sameIndex(index, info) for info in existing.values())
+        ]
+        MISSING_INDEXES.labels(collection=name).set(len(absent))
+        if absent:
+            missing[name] = absent
+    return missing
+
+
+if __name__ == "__main__":
+    from rencie.db import getDatabase
+
+    bank = getDatabase("bank")
+    if "--check" not in sys.argv:
+        ensureIndexes(bank)
+    missing = missingIndexes(bank)
+    for collection, names in missing.items():
+        print(f"missing on {collection}: {', '.join(names)}")
+    sys.exit(1 if missing else 0)
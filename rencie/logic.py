@@ -1,9 +1,9 @@
-from pymongo import MongoClient
 import math, random
+import base64
 import os
 from dotenv import load_dotenv
 import hashlib
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 from datetime import datetime, timezone, timedelta
 import bcrypt
@@ -12,22 +12,32 @@ import secrets
 import jwt
 from typing import Literal
 from rencie.config import *
+from rencie.db import client, getAsyncDatabase, lazyCollection
+from rencie.aio import runBlocking
+import rencie.exports as exports
+from rencie.statements import statementSummary
+from rencie.transfers import executeBulkTransfer, executeTransfer, fullName, transferRejected
 
 # load_dotenv(dotenv_path=r".\all.env")
 # load_dotenv()
 
 JWT_SECRET = str(os.getenv("JWT_SECRET"))
-MONGO = os.getenv("MONGODB")
 
-client = MongoClient(MONGO)
-db = client["bank"]
+# resolved on the process's shared client when first used (see rencie.db)
 userAccnts, transactions, otp, apiKey = (
-    db["accountInfo"],
-    db["Transactions"],
-    db["OTP"],
-    db["apiKeys"],
+    lazyCollection("bank", "accountInfo"),
+    lazyCollection("bank", "Transactions"),
+    lazyCollection("bank", "OTP"),
+    lazyCollection("bank", "apiKeys"),
 )
 
+
+# emails that must not hold up a request (the OTP) are sent from this pool
+emailPool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("EMAIL_WORKERS", "4")), thread_name_prefix="email"
+)
+
+
 class bank:
     def generate_user_id():
         return str(uuid.uuid4())
@@ -47,24 +57,70 @@ class bank:
         subject="Welcome",
         body="<p>Congrats on sending your <strong>first email</strong>!</p>",
         to="werayco@gmail.com",
+        attachments=None,
     ):
         import resend
 
         try:
             resend.api_key = os.getenv("RESEND_API_KEY")
-            client = resend.Emails.send(
-                {
-                    "from": "onboarding@resend.dev",
-                    "to": to,
-                    "subject": subject,
-                    "html": body,
-                }
-            )
+            email = {
+                "from": "onboarding@resend.dev",
+                "to": to,
+                "subject": subject,
+                "html": body,
+            }
+            if attachments:
+                email["attachments"] = attachments
+            client = resend.Emails.send(email)
             if client:
                 return {"status": "successful", "response": f"email send to {to}"}
         except Exception as e:
             return {"status": "failed", "reason": e}
 
+    def send_email_batch(emails: list):
+        "sends up to 100 {subject, body, to} emails with one Resend call"
+        import resend
+
+        try:
+            resend.api_key = os.getenv("RESEND_API_KEY")
+            sent = resend.Batch.send(
+                [
+                    {
+                        "from": "onboarding@resend.dev",
+                        "to": email["to"],
+                        "subject": email["subject"],
+                        "html": email["body"],
+                    }
+                    for email in emails
+                ]
+            )
+            if sent:
+                return {"status": "successful", "response": f"{len(emails)} emails sent"}
+        except Exception as e:
+            return {"status": "failed", "reason": e}
+
+    def logEmailFailure(future, to):
+        result = future.exception() or future.result()
+        if not isinstance(result, dict) or result.get("status") != "successful":
+            print(f"email to {to} failed: {result}")
+
+    def sendEmailLater(subject: str, body: str, to: str):
+        "queues the email on emailPool and returns its future, failures are logged"
+        future = emailPool.submit(bank.send_email, subject=subject, body=body, to=to)
+        future.add_done_callback(lambda done: bank.logEmailFailure(done, to))
+        return future
+
+    def sendEmailsLater(emails: list):
+        "queues {subject, body, to} emails on emailPool in Resend batches of 100"
+        futures = []
+        for start in range(0, len(emails), 100):
+            batch = emails[start : start + 100]
+            future = emailPool.submit(bank.send_email_batch, batch)
+            recipients = ", ".join(email["to"] for email in batch)
+            future.add_done_callback(lambda done, to=recipients: bank.logEmailFailure(done, to))
+            futures.append(future)
+        return futures
+
     def genTranID():
         return secrets.token_hex(16)
 
@@ -76,13 +132,13 @@ class bank:
             "otp": otp_code,
             "createdAt": bank.current_date(),
             "otpID": otpID,
-            "expiresAt": (
-                datetime.now(timezone.utc) + timedelta(minutes=30)
-            ).isoformat(),
+            # a Date, so the TTL index on expiresAt deletes it (see rencie.indexes)
+            "expiresAt": datetime.now(timezone.utc) + timedelta(minutes=30),
         }
 
         if otp.insert_one(otp_entry):
-            bank.send_email(
+            # the user is prompted for the OTP straight away, Resend delivers it meanwhile
+            bank.sendEmailLater(
                 subject=f"Hello, {name}!", body=f"Your OTP is {otp_code}", to=email
             )
             return {
@@ -155,25 +211,37 @@ class bank:
             "status": "successful",
         }
 
+    def loginResult(checkUser, pw: str):
+        "checks pw against the account document found for the login, and issues the token"
+        if not checkUser:
+            return {"status": "failed", "message": "User not found"}
+
+        hashed_pw = checkUser["hashedPassword"]
+        if isinstance(hashed_pw, str):
+            hashed_pw = hashed_pw.encode()
+
+        if not bcrypt.checkpw(pw.encode(), hashed_pw):
+            return {"status": "failed", "message": "Wrong password"}
+
+        token = bank.generate_token(checkUser)
+        return {
+            "status": "successful",
+            "token": token,
+            "message": "Login successful",
+        }
+
     def authenticateUser(accountNumber: int, pw: str):  # this is an endpoint
         try:
             checkUser = userAccnts.find_one({"accountNumber": accountNumber})
-            if not checkUser:
-                return {"status": "failed", "message": "User not found"}
-
-            hashed_pw = checkUser["hashedPassword"]
-            if isinstance(hashed_pw, str):
-                hashed_pw = hashed_pw.encode()
-
-            if not bcrypt.checkpw(pw.encode(), hashed_pw):
-                return {"status": "failed", "message": "Wrong password"}
+            return bank.loginResult(checkUser, pw)
+        except Exception as e:
+            return {"status": "failed", "response": "an error occured"}
 
-            token = bank.generate_token(checkUser)
-            return {
-                "status": "successful",
-                "token": token,
-                "message": "Login successful",
-            }
+    async def aauthenticateUser(accountNumber: int, pw: str):
+        "authenticateUser for the event loop: async lookup, bcrypt on the blocking pool"
+        try:
+            checkUser = await getAsyncDatabase("bank")["accountInfo"].find_one({"accountNumber": accountNumber})
+            return await runBlocking(bank.loginResult, checkUser, pw)
         except Exception as e:
             return {"status": "failed", "response": "an error occured"}
 
@@ -208,7 +276,13 @@ class bank:
             if not checkOTP:
                 return "Invalid OTP"
 
-            expires_at = datetime.fromisoformat(checkOTP["expiresAt"])
+            expires_at = checkOTP["expiresAt"]
+            if isinstance(expires_at, str):
+                # OTPs issued before expiresAt was stored as a Date
+                expires_at = datetime.fromisoformat(expires_at)
+            elif expires_at.tzinfo is None:
+                # pymongo returns naive UTC datetimes
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
             if expires_at <= datetime.now(timezone.utc):
                 return "OTP has expired"
 
@@ -221,28 +295,39 @@ class bank:
         except Exception as e:
             return {"status": "failed", "response": f"An error occurred: {e}"}
 
+    def balanceResult(checkUser, senderAccntNumber: str):
+        "the checkBalance response for the account document found (or None)"
+        if not checkUser:
+            return {"response": "user doesn't exists in our db", "status": "failed"}
+        balance, lastName, firstName = (
+            checkUser.get("accountBalance"),
+            checkUser.get("lastName"),
+            checkUser.get("firstName"),
+        )
+        return {
+            "response": {
+                "accountBalance": balance,
+                "accountNumber": senderAccntNumber,
+                "name": f"{firstName or ''} {lastName or ''}".strip(),
+                "currency": "NGN",
+            },
+            "status": "successful",
+        }
+
     def checkBalance(senderAccntNumber: str):
         try:
             checkUser = userAccnts.find_one({"accountNumber": senderAccntNumber})
-            if checkUser:
-                balance, lastName, firstName = (
-                    checkUser.get("accountBalance"),
-                    checkUser.get("lastName"),
-                    checkUser.get("firstName"),
-                )
-                return {
-                    "response": {
-                        "accountBalance": balance,
-                        "accountNumber": senderAccntNumber,
-                        "name": firstName + " " + lastName,
-                        "currency": "NGN",
-                    },
-                    "status": "successful",
-                }
-            else:
-                return {"response": "user doesn't exists in our db", "status": "failed"}
+            return bank.balanceResult(checkUser, senderAccntNumber)
+        except Exception as e:
+            return {"status": "failed", "response": f"an error {e} occured while checking the balance"}
+
+    async def acheckBalance(senderAccntNumber: str):
+        "checkBalance for the event loop, only the lookup differs"
+        try:
+            checkUser = await getAsyncDatabase("bank")["accountInfo"].find_one({"accountNumber": senderAccntNumber})
+            return bank.balanceResult(checkUser, senderAccntNumber)
         except Exception as e:
-            pass
+            return {"status": "failed", "response": f"an error {e} occured while checking the balance"}
 
     @celery_app.task
     def transferMoney(
@@ -273,80 +358,28 @@ class bank:
                     "response": "Recipient account number is invalid",
                     "status": "failed",
                 }
-            with ThreadPoolExecutor(max_workers=3) as workers:
-                w1 = workers.submit(userAccnts.find_one,{"accountNumber": senderAccntNumber})
-                w2 = workers.submit(userAccnts.find_one,{"accountNumber": recipientAccntNumber})
-                
-                results = []
-            for future in as_completed([w1, w2]):
-                result = future.result()
-                results.append(result)
-
-            senderData = w1.result()
-            recipientData = w2.result()
-
-            senderEmail = senderData.get("emailAddress", "") if senderData else ""
-            recipientEmail = (
-                recipientData.get("emailAddress", "") if recipientData else ""
-            )
-
-            if not senderData:
-                return {
-                    "response": "Sender doesn't exist in database",
-                    "status": "failed",
-                }
-            if not recipientData:
-                return {
-                    "response": "Recipient doesn't exist in database",
-                    "status": "failed",
-                }
-
-            recipientName = f"{recipientData.get('lastName', '')} {recipientData.get('firstName', '')}".strip()
-
-            currentBalance = senderData.get("accountBalance", 0)
-            if currentBalance < amount:
-                return {
-                    "status": "failed",
-                    "response": "You don't have enough money in your account",
-                }
             print("transfering....")
-            with client.start_session() as session:
-                with session.start_transaction():
-
-                    userAccnts.update_one(
-                        {"accountNumber": senderAccntNumber},
-                        {"$inc": {"accountBalance": -amount}},
-                        session=session,
-                    )
-
-                    userAccnts.update_one(
-                        {"accountNumber": recipientAccntNumber},
-                        {"$inc": {"accountBalance": amount}},
-                        session=session,
-                    )
-
-                    transactionID = bank.genTranID()
-                    transactions.insert_one(
-                        {
-                            "senderInfo": {
-                                "name": senderName,
-                                "accountNumber": senderAccntNumber,
-                            },
-                            "recipientInfo": {
-                                "name": recipientName,
-                                "accountNumber": recipientAccntNumber,
-                            },
-                            "amount": amount,
-                            "status": "successful",
-                            "transactionID": transactionID,
-                            "transactionCreatedAt": bank.current_date(),
-                        },
-                        session=session,
-                    )
-
-                    newBalance = userAccnts.find_one(
-                        {"accountNumber": senderAccntNumber}, session=session
-                    ).get("accountBalance", 0)
+            # debit (only while the balance covers it), credit and ledger entry in one
+            # transaction, retried on write conflicts (see rencie.transfers)
+            transactionID = bank.genTranID()
+            try:
+                senderData, recipientData = executeTransfer(
+                    client,
+                    userAccnts,
+                    transactions,
+                    senderAccntNumber,
+                    recipientAccntNumber,
+                    amount,
+                    senderName,
+                    transactionID,
+                )
+            except transferRejected as e:
+                return {"status": "failed", "response": e.response}
+
+            newBalance = senderData.get("accountBalance", 0)
+            senderEmail = senderData.get("emailAddress", "")
+            recipientEmail = recipientData.get("emailAddress", "")
+            recipientName = fullName(recipientData)
 
             bank.send_email(
                 subject="Debit Alert",
@@ -370,9 +403,66 @@ class bank:
         except Exception as e:
             return {"status": "failed", "response": str(e)}
 
+    def bulkTransfer(senderAccntNumber: str, senderName: str, transfers: list):
+        """pays every {receipientAccntNumber, amount} in transfers from one account, in
+        chunked transactions (see rencie.transfers), and reports on each item"""
+        try:
+            if len(senderAccntNumber) != 10 or not senderAccntNumber.isdigit():
+                return {"response": "Your account number is invalid", "status": "failed"}
+
+            batchID = bank.genTranID()
+            report, senderData, recipients = executeBulkTransfer(
+                client,
+                userAccnts,
+                transactions,
+                senderAccntNumber,
+                senderName,
+                [(item["receipientAccntNumber"], item["amount"]) for item in transfers],
+                batchID,
+                bank.genTranID,
+            )
+            paid = [item for item in report if item["status"] == "successful"]
+            total = sum(item["amount"] for item in paid)
+
+            # one debit alert for the batch, the credit alerts in Resend batches
+            emails = [
+                {
+                    "subject": "Credit Alert",
+                    "body": f"<p>Hi {fullName(recipients[item['receipientAccntNumber']])},<br/>You have received {item['amount']} NGN from account number {senderAccntNumber}.</p>",
+                    "to": recipients[item["receipientAccntNumber"]].get("emailAddress", ""),
+                }
+                for item in paid
+            ]
+            if paid:
+                emails.insert(
+                    0,
+                    {
+                        "subject": "Debit Alert",
+                        "body": f"<p>Hi {senderName},<br/>You have sent {total} NGN to {len(paid)} accounts.</p>",
+                        "to": senderData.get("emailAddress", ""),
+                    },
+                )
+            bank.sendEmailsLater([email for email in emails if email["to"]])
+
+            return {
+                "status": "success" if len(paid) == len(report) else "partial" if paid else "failed",
+                "response": f"{len(paid)} of {len(report)} transfers successful",
+                "batchID": batchID,
+                "totalDebited": total,
+                "newBalance": senderData.get("accountBalance") if senderData else None,
+                "transfers": report,
+            }
+
+        except Exception as e:
+            return {"status": "failed", "response": str(e)}
+
     def decodeJWT(token):
+        "the claims of a session token from generate_token, or a failed response"
         try:
             decoded = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+            # tokens minted for one purpose (statement download links) are not sessions
+            if "aud" in decoded or "purpose" in decoded:
+                raise jwt.exceptions.InvalidTokenError("not a session token")
             return decoded
         except jwt.exceptions.ExpiredSignatureError:
             return {
@@ -386,32 +476,15 @@ class bank:
             }
 
     @celery_app.task
-    def getBankStatement(yourAccntNumber, name, email):
-        # yourAccntNumber, name, email = data[0], data[1], data[2]
+    def getBankStatement(yourAccntNumber, name, email, start=None, end=None):
+        """emails a summary of the account's transactions, optionally only those from
+        start (inclusive) to end (exclusive); MongoDB computes it (see rencie.statements)"""
+        summary = statementSummary(transactions, yourAccntNumber, start, end)
+        totalTransactions = summary["totalTransactions"]
+        totalmoneyOut = summary["moneyOut"]
+        totalmoneyIn = summary["moneyIn"]
+        uniqueTransactors = summary["counterparties"]
 
-        recordOut = list(
-            transactions.find({"senderInFo.accountNumber": yourAccntNumber})
-        )
-        recordIn = list(
-            transactions.find({"receiverInFo.accountNumber": yourAccntNumber})
-        )
-
-        moneyOut = [everyTransaction.get("amount") for everyTransaction in recordOut]
-        moneyIn = [everyTransaction.get("amount") for everyTransaction in recordIn]
-
-        totalmoneyOut = sum(moneyOut)
-        totalmoneyIn = sum(moneyIn)
-
-        uniqueTransactors = list(
-            set(
-                [
-                    everyTransaction.get("receiverInFo").get("name")
-                    for everyTransaction in recordOut
-                ]
-            )
-        )
-
-        totalTransactions: int = len(recordOut) + len(recordIn)
         bank.send_email(
             subject=f"Your Bank Statement is here, {name}",
             body=(
@@ -429,6 +502,53 @@ class bank:
             "response": "your bank statement has been sent to your email",
         }
 
+    @celery_app.task
+    def exportStatement(yourAccntNumber, name, email, fmt="csv", start=None, end=None):
+        """writes the account's itemised transactions from start (inclusive) to end
+        (exclusive) to a CSV or PDF in GridFS, streaming (see rencie.exports), and
+        emails it as an attachment or, when large, a download link"""
+        bucket = exports.getExportBucket()
+        exports.purgeExpiredExports(bucket)
+        export = exports.exportStatement(
+            transactions,
+            bucket,
+            yourAccntNumber,
+            fmt,
+            start,
+            end,
+            title=f"Rencie statement for {name} ({yourAccntNumber})",
+        )
+
+        attachments = None
+        if export["bytes"] <= exports.EXPORT_ATTACH_MAX_BYTES:
+            content = bucket.open_download_stream(export["fileID"]).read()
+            attachments = [{"filename": export["filename"], "content": base64.b64encode(content).decode()}]
+            delivery = "It is attached to this email."
+        else:
+            token = exports.downloadToken(export["fileID"], yourAccntNumber, JWT_SECRET)
+            link = f"{os.getenv('PUBLIC_BASE_URL', 'https://rencie.devrayco.name.ng')}/api/v1/statement-export/{token}"
+            delivery = f'<a href="{link}">Download it here</a>, the link is valid for {exports.EXPORT_TTL_HOURS:g} hours.'
+
+        bank.send_email(
+            subject=f"Your full bank statement is ready, {name}",
+            body=f"<p>Hi {name},<br/>Your statement has {export['rows']} transactions. {delivery}</p>",
+            to=email,
+            attachments=attachments,
+        )
+        return {
+            "status": "successful",
+            "response": "your statement export has been sent to your email",
+            "fileID": str(export["fileID"]),
+            "rows": export["rows"],
+        }
+
+    @celery_app.task
+    def pruneCheckpoints():
+        "one agent.retention pass over the chat checkpoints, scheduled by celery beat"
+        from agent.retention import fromEnv
+
+        return {"status": "successful", "bytesReclaimed": fromEnv().runOnce()}
+
     @staticmethod
     def genApiKey():
         key = secrets.token_urlsafe(24)
@@ -0,0 +1,92 @@
+from pymongo import monitoring
+from prometheus_client import Counter, Gauge, Histogram
+
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command latency as seen by the driver",
+    ["database", "command", "status"],
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5],
+)
+
+
+class mongoCommandMetrics(monitoring.CommandListener):
+    "times every command sent by the MongoClients of this process"
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_LATENCY.labels(
+            database=event.database_name, command=event.command_name, status="ok"
+        ).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_COMMAND_LATENCY.labels(
+            database=event.database_name, command=event.command_name, status="error"
+        ).observe(event.duration_micros / 1e6)
+
+
+MONGO_POOL_OPEN = Gauge(
+    "mongo_pool_connections", "Connections open in the driver's pool", ["address"]
+)
+MONGO_POOL_CHECKED_OUT = Gauge(
+    "mongo_pool_checked_out", "Pooled connections currently in use", ["address"]
+)
+MONGO_POOL_MAX = Gauge("mongo_pool_max_size", "maxPoolSize of this process's MongoClient")
+MONGO_POOL_WAIT = Histogram(
+    "mongo_pool_checkout_wait_seconds",
+    "Time an operation waited for a pooled connection",
+    ["status"],
+    buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+)
+MONGO_POOL_CLEARED = Counter(
+    "mongo_pool_cleared_total", "Times the driver cleared a pool after a network error", ["address"]
+)
+
+
+def poolAddress(event):
+    host, port = event.address
+    return f"{host}:{port}"
+
+
+class mongoPoolMetrics(monitoring.ConnectionPoolListener):
+    "pool size, utilisation and checkout waits of the MongoClients of this process"
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        MONGO_POOL_CLEARED.labels(address=poolAddress(event)).inc()
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        MONGO_POOL_OPEN.labels(address=poolAddress(event)).inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        MONGO_POOL_OPEN.labels(address=poolAddress(event)).dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_WAIT.labels(status=event.reason).observe(event.duration)
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_WAIT.labels(status="ok").observe(event.duration)
+        MONGO_POOL_CHECKED_OUT.labels(address=poolAddress(event)).inc()
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.labels(address=poolAddress(event)).dec()
+
+
+def mongoListeners():
+    "the listeners rencie.db attaches to every client it opens"
+    return [mongoCommandMetrics(), mongoPoolMetrics()]
@@ -0,0 +1,95 @@
+"""Bank statements computed by MongoDB instead of in the worker.
+
+statementSummary() runs one aggregation: a $match served by the sender and
+recipient history indexes (see rencie.indexes), then a $facet that groups the
+money sent and the money received separately. Only the totals, counts and
+distinct counterparties come back, so a statement costs the same worker memory
+for one transaction or a million.
+
+Bounds are on transactionCreatedAt, start inclusive and end exclusive. The
+ledger stores it as an ISO-8601 UTC string, which sorts like the date it holds,
+so bounds are compared in the same format.
+"""
+from datetime import date, datetime, timezone
+
+
+def isoBound(value):
+    "a datetime, date or ISO string as the ledger's UTC ISO format, None stays None"
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+def createdBetween(start=None, end=None):
+    "the transactionCreatedAt condition for [start, end), {} when unbounded"
+    bounds = {}
+    if start is not None:
+        bounds["$gte"] = isoBound(start)
+    if end is not None:
+        bounds["$lt"] = isoBound(end)
+    return {"transactionCreatedAt": bounds} if bounds else {}
+
+
+def totals(counterparty):
+    "the $group stage of one side of the statement"
+    return {
+        "$group": {
+            "_id": None,
+            "total": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+            "counterparties": {"$addToSet": f"${counterparty}.name"},
+        }
+    }
+
+
+def statementPipeline(accountNumber, start=None, end=None):
+    created = createdBetween(start, end)
+    return [
+        # one branch per index, each with the date range so it bounds the index scan
+        {
+            "$match": {
+                "$or": [
+                    {"senderInfo.accountNumber": accountNumber, **created},
+                    {"recipientInfo.accountNumber": accountNumber, **created},
+                ]
+            }
+        },
+        {
+            "$facet": {
+                "sent": [
+                    {"$match": {"senderInfo.accountNumber": accountNumber}},
+                    totals("recipientInfo"),
+                ],
+                "received": [
+                    {"$match": {"recipientInfo.accountNumber": accountNumber}},
+                    totals("senderInfo"),
+                ],
+            }
+        },
+    ]
+
+
+def statementSummary(collection, accountNumber, start=None, end=None):
+    """{moneyOut, moneyIn, sentCount, receivedCount, totalTransactions, counterparties}
+    for the account's transactions in [start, end)"""
+    facets = next(collection.aggregate(statementPipeline(accountNumber, start, end)), {})
+    sent = (facets.get("sent") or [{}])[0]
+    received = (facets.get("received") or [{}])[0]
+    counterparties = sorted(
+        set(sent.get("counterparties", [])) | set(received.get("counterparties", [])),
+        key=str,
+    )
+    return {
+        "moneyOut": sent.get("total", 0),
+        "moneyIn": received.get("total", 0),
+        "sentCount": sent.get("count", 0),
+        "receivedCount": received.get("count", 0),
+        "totalTransactions": sent.get("count", 0) + received.get("count", 0),
+        "counterparties": [name for name in counterparties if name],
+    }
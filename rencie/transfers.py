@@ -0,0 +1,304 @@
+"""Transfer engine: one transaction, four round trips, no read-then-write race.
+
+The debit is a single conditional find_one_and_update that only matches while
+the balance covers the amount and returns the sender's new balance, so two
+concurrent transfers cannot both spend the same money. The credit returns the
+recipient's name and email, and the ledger entry is inserted in the same
+transaction.
+
+Concurrent transactions on the same account fail with a WriteConflict labelled
+TransientTransactionError; the whole transaction is then retried after an
+exponential, fully jittered backoff until TRANSFER_TIMEOUT seconds have passed
+(the same time-bounded contract as pymongo's with_transaction, which caps it at
+120s). A commit whose outcome is unknown (UnknownTransactionCommitResult) is
+committed again, which is safe, within the same deadline.
+
+executeBulkTransfer pays many recipients from one account: one $in query
+validates every recipient, then each chunk of BULK_TRANSFER_CHUNK_SIZE items is
+one transaction of one debit, one bulk_write of credits and one insert_many of
+ledger entries.
+"""
+import os
+import random
+import time
+from datetime import datetime, timezone
+from prometheus_client import Counter
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import PyMongoError
+
+TRANSFER_OUTCOMES = Counter(
+    "bank_transfers_total", "Transfers by outcome", ["outcome"]
+)
+TRANSACTION_RETRIES = Counter(
+    "bank_transaction_retries_total",
+    "Transfer transactions or commits retried after a transient error",
+    ["reason"],
+)
+
+BULK_TRANSFER_CHUNK_SIZE = int(os.getenv("BULK_TRANSFER_CHUNK_SIZE", "250"))
+TRANSFER_TIMEOUT = float(os.getenv("TRANSFER_TIMEOUT", "10"))
+TRANSFER_RETRY_BACKOFF = float(os.getenv("TRANSFER_RETRY_BACKOFF", "0.005"))
+TRANSFER_MAX_BACKOFF = float(os.getenv("TRANSFER_MAX_BACKOFF", "0.1"))
+
+PARTY = {"_id": 0, "accountNumber": 1, "accountBalance": 1, "firstName": 1, "lastName": 1, "emailAddress": 1}
+
+
+class transferRejected(Exception):
+    "the transfer was refused, the message is meant for the user"
+
+    def __init__(self, response, outcome):
+        super().__init__(response)
+        self.response = response
+        self.outcome = outcome
+
+
+def fullName(account):
+    return f"{account.get('lastName', '')} {account.get('firstName', '')}".strip()
+
+
+def commit(session, deadline):
+    while True:
+        try:
+            session.commit_transaction()
+            return
+        except PyMongoError as e:
+            if not e.has_error_label("UnknownTransactionCommitResult") or time.monotonic() >= deadline:
+                raise
+            TRANSACTION_RETRIES.labels(reason="unknown_commit_result").inc()
+
+
+def retryDelay(attempt, backoff, max_backoff):
+    "full-jitter exponential backoff: uniform in [0, min(max_backoff, backoff * 2**attempt)]"
+    return random.uniform(0, min(max_backoff, backoff * 2 ** min(attempt, 32)))
+
+
+def runTransaction(client, body, timeout=None, backoff=None, max_backoff=None):
+    """runs body(session) in a transaction and commits it, retrying the whole
+    transaction on TransientTransactionError until timeout seconds have passed.
+    returns body's result"""
+    timeout = TRANSFER_TIMEOUT if timeout is None else timeout
+    backoff = TRANSFER_RETRY_BACKOFF if backoff is None else backoff
+    max_backoff = TRANSFER_MAX_BACKOFF if max_backoff is None else max_backoff
+    deadline = time.monotonic() + timeout
+    with client.start_session() as session:
+        attempt = 0
+        while True:
+            session.start_transaction()
+            try:
+                result = body(session)
+                commit(session, deadline)
+                return result
+            except PyMongoError as e:
+                if session.in_transaction:
+                    session.abort_transaction()
+                if not e.has_error_label("TransientTransactionError"):
+                    raise
+                delay = retryDelay(attempt, backoff, max_backoff)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                TRANSACTION_RETRIES.labels(reason="transient").inc()
+                attempt += 1
+                time.sleep(delay)
+            except BaseException:
+                if session.in_transaction:
+                    session.abort_transaction()
+                raise
+
+
+def transferBody(accounts, ledger, sender, recipient, amount, senderName, transactionID):
+    "the transaction's three operations, for runTransaction"
+
+    def body(session):
+        debited = accounts.find_one_and_update(
+            {"accountNumber": sender, "accountBalance": {"$gte": amount}},
+            {"$inc": {"accountBalance": -amount}},
+            projection=PARTY,
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if debited is None:
+            # the only read outside the happy path: which of the two conditions failed
+            if accounts.find_one({"accountNumber": sender}, {"_id": 1}, session=session):
+                raise transferRejected("You don't have enough money in your account", "insufficient_funds")
+            raise transferRejected("Sender doesn't exist in database", "sender_not_found")
+
+        credited = accounts.find_one_and_update(
+            {"accountNumber": recipient},
+            {"$inc": {"accountBalance": amount}},
+            projection=PARTY,
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if credited is None:
+            # aborting the transaction puts the debit back
+            raise transferRejected("Recipient doesn't exist in database", "recipient_not_found")
+
+        ledger.insert_one(
+            {
+                "senderInfo": {"name": senderName, "accountNumber": sender},
+                "recipientInfo": {"name": fullName(credited), "accountNumber": recipient},
+                "amount": amount,
+                "status": "successful",
+                "transactionID": transactionID,
+                "transactionCreatedAt": datetime.now(timezone.utc).isoformat(),
+            },
+            session=session,
+        )
+        return debited, credited
+
+    return body
+
+
+def executeTransfer(client, accounts, ledger, sender, recipient, amount, senderName, transactionID):
+    """moves amount from sender to recipient and records it. returns (sender, recipient)
+    as they are after the transfer, raises transferRejected when it cannot happen"""
+    try:
+        debited, credited = runTransaction(
+            client, transferBody(accounts, ledger, sender, recipient, amount, senderName, transactionID)
+        )
+    except transferRejected as e:
+        TRANSFER_OUTCOMES.labels(outcome=e.outcome).inc()
+        raise
+    except Exception:
+        TRANSFER_OUTCOMES.labels(outcome="error").inc()
+        raise
+    TRANSFER_OUTCOMES.labels(outcome="committed").inc()
+    return debited, credited
+
+
+def recipientError(sender, recipient, amount):
+    "why this bulk item cannot be paid, before looking anything up"
+    if amount <= 0:
+        return "Invalid transfer amount"
+    if len(recipient) != 10 or not recipient.isdigit():
+        return "Recipient account number is invalid"
+    if recipient == sender:
+        return "You cannot transfer money to your own account"
+    return None
+
+
+def affordable(chunk, balance):
+    "the longest prefix of chunk the balance covers, and its total"
+    total = 0
+    for position, (_, _, amount, _) in enumerate(chunk):
+        if total + amount > balance:
+            return chunk[:position], total
+        total += amount
+    return chunk, total
+
+
+def bulkChunkBody(accounts, ledger, sender, senderName, chunk, recipients, batchID):
+    """one chunk's transaction, for runTransaction. chunk holds (index, recipient,
+    amount, transactionID); items are paid in order until the balance runs out.
+    returns (sender after the debit, items paid)"""
+
+    def debit(total, session):
+        return accounts.find_one_and_update(
+            {"accountNumber": sender, "accountBalance": {"$gte": total}},
+            {"$inc": {"accountBalance": -total}},
+            projection=PARTY,
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+
+    def body(session):
+        paid = chunk
+        debited = debit(sum(item[2] for item in chunk), session)
+        if debited is None:
+            current = accounts.find_one({"accountNumber": sender}, PARTY, session=session)
+            if current is None:
+                raise transferRejected("Sender doesn't exist in database", "sender_not_found")
+            paid, total = affordable(chunk, current.get("accountBalance", 0))
+            if not paid:
+                return current, []
+            debited = debit(total, session)
+            if debited is None:
+                raise transferRejected("You don't have enough money in your account", "insufficient_funds")
+
+        credits = {}
+        for _, recipient, amount, _ in paid:
+            credits[recipient] = credits.get(recipient, 0) + amount
+        result = accounts.bulk_write(
+            [UpdateOne({"accountNumber": r}, {"$inc": {"accountBalance": a}}) for r, a in credits.items()],
+            ordered=False,
+            session=session,
+        )
+        if result.matched_count != len(credits):
+            raise transferRejected("A recipient account no longer exists", "recipient_not_found")
+
+        createdAt = datetime.now(timezone.utc).isoformat()
+        ledger.insert_many(
+            [
+                {
+                    "senderInfo": {"name": senderName, "accountNumber": sender},
+                    "recipientInfo": {"name": fullName(recipients[recipient]), "accountNumber": recipient},
+                    "amount": amount,
+                    "status": "successful",
+                    "transactionID": transactionID,
+                    "batchID": batchID,
+                    "transactionCreatedAt": createdAt,
+                }
+                for _, recipient, amount, transactionID in paid
+            ],
+            ordered=False,
+            session=session,
+        )
+        return debited, paid
+
+    return body
+
+
+def executeBulkTransfer(client, accounts, ledger, sender, senderName, items, batchID, newID, chunk_size=None):
+    """pays every (recipient, amount) in items from sender. returns (report, sender
+    after the last debit or None, {accountNumber: recipient}), the report holding one
+    result per item in the order given"""
+    chunk_size = chunk_size or BULK_TRANSFER_CHUNK_SIZE
+    report = [
+        {"receipientAccntNumber": recipient, "amount": amount, "status": "failed", "response": error}
+        for (recipient, amount), error in (
+            (item, recipientError(sender, *item)) for item in items
+        )
+    ]
+    wanted = {item["receipientAccntNumber"] for item in report if item["response"] is None}
+    recipients = {
+        account["accountNumber"]: account
+        for account in accounts.find({"accountNumber": {"$in": list(wanted)}}, PARTY)
+    }
+    pending = []
+    for index, item in enumerate(report):
+        if item["response"] is not None:
+            continue
+        if item["receipientAccntNumber"] not in recipients:
+            item["response"] = "Recipient doesn't exist in database"
+            continue
+        pending.append((index, item["receipientAccntNumber"], item["amount"], newID()))
+
+    senderAfter = None
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        try:
+            senderAfter, paid = runTransaction(
+                client, bulkChunkBody(accounts, ledger, sender, senderName, chunk, recipients, batchID)
+            )
+        except transferRejected as e:
+            TRANSFER_OUTCOMES.labels(outcome=e.outcome).inc(len(chunk))
+            for index, *_ in chunk:
+                report[index]["response"] = e.response
+            continue
+        except Exception as e:
+            TRANSFER_OUTCOMES.labels(outcome="error").inc(len(chunk))
+            for index, *_ in chunk:
+                report[index]["response"] = f"an error {e} occured during the transfer"
+            continue
+
+        TRANSFER_OUTCOMES.labels(outcome="committed").inc(len(paid))
+        for index, _, _, transactionID in paid:
+            report[index].update(status="successful", response="Transfer successful", transactionID=transactionID)
+        if len(paid) < len(chunk):
+            # paid in order: once the balance runs out, nothing after it is attempted
+            unpaid = pending[start + len(paid):]
+            TRANSFER_OUTCOMES.labels(outcome="insufficient_funds").inc(len(unpaid))
+            for index, *_ in unpaid:
+                report[index]["response"] = "You don't have enough money in your account"
+            break
+    return report, senderAfter, recipients
@@ -0,0 +1,83 @@
+"""A cancelled half-open probe must not wedge the circuit breaker."""
+import asyncio
+
+import pytest
+
+from agent.gateway import CLOSED, HALF_OPEN, LLMUnavailable, circuitBreaker, llmGateway
+
+
+class slowModel:
+    "answers after `delay` seconds, or raises `error` when given"
+
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return "answer"
+
+    async def astream(self, input, config=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        yield "answer"
+
+
+def halfOpenGateway():
+    "a gateway whose breaker has just opened and may probe again straight away"
+    gateway = llmGateway(breaker=circuitBreaker(window=2, min_calls=2, failure_rate=0.5, cooldown=0))
+    failing = slowModel(error=RuntimeError("provider down"))
+
+    async def trip():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await gateway.ainvoke(failing, None, "hi")
+
+    asyncio.run(trip())
+    return gateway
+
+
+@pytest.mark.parametrize("call", ["ainvoke", "astream"])
+def test_cancelled_probe_lets_the_next_call_probe(call):
+    gateway = halfOpenGateway()
+
+    async def scenario():
+        async def probe():
+            if call == "ainvoke":
+                return await gateway.ainvoke(slowModel(delay=60), None, "hi")
+            return [chunk async for chunk in gateway.astream(slowModel(delay=60), None, "hi")]
+
+        task = asyncio.create_task(probe())
+        await asyncio.sleep(0.05)
+        assert gateway.breaker.state == HALF_OPEN and gateway.breaker._probing
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # the probe was given back: the next call reaches the provider and closes the breaker
+        assert await gateway.ainvoke(slowModel(), None, "hi") == "answer"
+
+    asyncio.run(scenario())
+    assert gateway.breaker.state == CLOSED
+    assert gateway._inFlight == 0
+
+
+def test_outer_wait_for_timeout_releases_the_probe():
+    gateway = halfOpenGateway()
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(gateway.ainvoke(slowModel(delay=60), None, "hi"), 0.05)
+        assert await gateway.ainvoke(slowModel(), None, "hi") == "answer"
+
+    asyncio.run(scenario())
+    assert gateway.breaker.state == CLOSED
+
+
+def test_open_breaker_without_fallback_still_fails_fast():
+    gateway = halfOpenGateway()
+    gateway.breaker.cooldown = 60
+    gateway.breaker._open()
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(gateway.ainvoke(slowModel(), None, "hi"))
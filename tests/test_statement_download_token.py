@@ -0,0 +1,54 @@
+"""A statement download link must not work as a session token."""
+from fastapi.testclient import TestClient
+
+import fastapp
+import rencie.exports as exports
+import rencie.logic as logic
+
+ACCOUNT = "9876543210"
+
+
+def sessionToken():
+    return logic.bank.generate_token(
+        {"accountNumber": ACCOUNT, "userID": "u1", "emailAddress": "ray@example.com", "firstName": "Ray"}
+    )
+
+
+def test_download_token_is_refused_by_check_balance(monkeypatch):
+    looked_up = []
+
+    async def acheckBalance(accountNumber):
+        looked_up.append(accountNumber)
+        return {"status": "successful", "response": {"accountBalance": 500_000}}
+
+    monkeypatch.setattr(logic.bank, "acheckBalance", acheckBalance)
+    link = exports.downloadToken("0123456789abcdef01234567", ACCOUNT, logic.JWT_SECRET)
+
+    response = TestClient(fastapp.app).post("/api/v1/check-balance", json={"token": link})
+
+    assert response.json()["status"] == "failed"
+    assert looked_up == []
+
+
+def test_session_token_still_checks_the_balance(monkeypatch):
+    async def acheckBalance(accountNumber):
+        return {"status": "successful", "response": {"accountNumber": accountNumber}}
+
+    monkeypatch.setattr(logic.bank, "acheckBalance", acheckBalance)
+
+    response = TestClient(fastapp.app).post("/api/v1/check-balance", json={"token": sessionToken()})
+
+    assert response.json()["response"]["response"]["accountNumber"] == ACCOUNT
+
+
+def test_session_token_is_not_a_download_token():
+    import jwt
+    import pytest
+
+    with pytest.raises(jwt.InvalidTokenError):
+        exports.readDownloadToken(sessionToken(), logic.JWT_SECRET)
+
+
+def test_download_token_round_trips():
+    link = exports.downloadToken("0123456789abcdef01234567", ACCOUNT, logic.JWT_SECRET)
+    assert exports.readDownloadToken(link, logic.JWT_SECRET) == ("0123456789abcdef01234567", ACCOUNT)